@@ -0,0 +1,209 @@
+"""
+Local stand-in for the OpenAI endpoints InstantGPT uses, for offline benchmarks.
+
+Serves /v1/audio/transcriptions, /v1/chat/completions (plain and streamed) and
+/v1/models with a configurable latency, token throughput and error rate, and
+counts the bytes it receives. GET /_stats returns the counters as JSON.
+
+Run it on its own with:
+    python -m benchmarks.fake_openai --port 8765 --latency 0.3
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRANSCRIPT_WORDS = "the quick brown fox jumps over the lazy dog".split()
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.2, jitter=0.05, tokens_per_second=80.0,
+                 response_tokens=200, error_rate=0.0, error_status=500, seed=0):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def handle_error(self, request, client_address):
+        # Clients dropping idle keep-alive connections is expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count(self, endpoint, field, amount=1):
+        with self.lock:
+            endpoint_stats = self.stats.setdefault(endpoint, {"requests": 0, "bytes_received": 0, "errors": 0})
+            endpoint_stats[field] += amount
+
+    def delay(self):
+        """
+        Sleep for the configured time to first byte.
+        """
+        with self.lock:
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, delay))
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            with self.server.lock:
+                self.send_json(200, self.server.stats)
+        elif self.path.rstrip("/").endswith("/models"):
+            self.server.count("models", "requests")
+            self.send_json(200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/audio/transcriptions"):
+            endpoint = "transcriptions"
+        elif self.path.endswith("/chat/completions"):
+            endpoint = "chat"
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        self.server.count(endpoint, "requests")
+        self.server.count(endpoint, "bytes_received", len(body))
+
+        self.server.delay()
+        if self.server.should_fail():
+            self.server.count(endpoint, "errors")
+            status = self.server.error_status
+            headers = {"Retry-After": "1"} if status == 429 else None
+            self.send_json(status, {"error": {"message": "Injected error", "type": "server_error"}}, headers)
+            return
+
+        if endpoint == "transcriptions":
+            # Roughly one word per 10 KB of upload
+            words = max(1, len(body) // 10240)
+            text = " ".join(TRANSCRIPT_WORDS[i % len(TRANSCRIPT_WORDS)] for i in range(words))
+            self.send_json(200, {"text": text})
+            return
+
+        request = json.loads(body or b"{}")
+        if request.get("stream"):
+            self.stream_completion(request.get("model", "fake"))
+        else:
+            time.sleep(self.server.response_tokens / self.server.tokens_per_second)
+            self.send_json(200, self.completion(request.get("model", "fake")))
+
+    def tokens(self):
+        return [f"{TRANSCRIPT_WORDS[i % len(TRANSCRIPT_WORDS)]} " for i in range(self.server.response_tokens)]
+
+    def completion(self, model):
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(self.tokens())},
+                "finish_reason": "stop",
+            }],
+        }
+
+    def stream_completion(self, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(payload):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        interval = 1.0 / self.server.tokens_per_second
+        for token in self.tokens():
+            send_event(json.dumps({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }))
+            time.sleep(interval)
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_server(port=0, **options):
+    """
+    Start a FakeOpenAIServer on a background thread.
+    Returns the server; its base URL is http://127.0.0.1:<server.server_port>/v1.
+    """
+    server = FakeOpenAIServer(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first byte of each response")
+    parser.add_argument("--jitter", type=float, default=0.05, help="random +/- variation of the latency, in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="completion throughput")
+    parser.add_argument("--response-tokens", type=int, default=200, help="tokens in each completion")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of injected errors (429 adds Retry-After)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the latency jitter and error injection")
+
+
+def server_options(args):
+    return {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "tokens_per_second": args.tokens_per_second,
+        "response_tokens": args.response_tokens,
+        "error_rate": args.error_rate,
+        "error_status": args.error_status,
+        "seed": args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server for benchmarks")
+    parser.add_argument("--port", type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(("127.0.0.1", args.port), **server_options(args))
+    print(f"Fake OpenAI server listening on http://127.0.0.1:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+End-to-end latency benchmark for InstantGPT, run against a local fake OpenAI server.
+
+Feeds WAV fixtures (synthetic, or recordings passed with --wav) and a synthetic
+screenshot through the audio splitting, transcription, chat and vision paths,
+and writes per-stage p50/p95/p99 latencies, bytes uploaded and RSS growth,
+plus the peak RSS of the whole run, to a JSON file. Pass --compare with an earlier result to see the change per stage.
+
+    python -m benchmarks.run --iterations 20
+    python -m benchmarks.run --compare benchmarks/results/<commit>.json
+
+Runs offline: nothing is sent to the real API.
+"""
+import os
+import sys
+import json
+import time
+import wave
+import socket
+import shutil
+import platform
+import argparse
+import resource
+import tempfile
+import subprocess
+import urllib.request
+from benchmarks.fake_openai import add_server_arguments, server_options
+from utils.errors import InstantGPTError
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+FIXTURE_RATE = 48000
+FIXTURE_CHANNELS = 2
+
+
+def percentile(values, q):
+    """
+    Linearly interpolated percentile of a list of numbers, q between 0 and 100.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb():
+    """
+    Resident memory right now, or None where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * resource.getpagesize() / (1024 * 1024)
+
+
+def write_speech_fixture(path, seconds, rate=FIXTURE_RATE, channels=FIXTURE_CHANNELS):
+    """
+    Write a deterministic speech-like WAV: voiced bursts separated by short pauses.
+    """
+    import numpy as np
+
+    generator = np.random.default_rng(0)
+    t = np.arange(int(seconds * rate)) / rate
+    envelope = (np.sin(2 * np.pi * 0.4 * t) > -0.3).astype(np.float32)  # About 1.6 s of speech per 0.9 s pause
+    voice = np.sin(2 * np.pi * 180 * t) + 0.5 * np.sin(2 * np.pi * 360 * t) + 0.2 * generator.standard_normal(len(t))
+    samples = (3000 * envelope * voice + 30 * generator.standard_normal(len(t))).astype(np.int16)
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(np.repeat(samples[:, None], channels, axis=1).tobytes())
+    return path
+
+
+def make_screenshot(index):
+    """
+    Synthetic screenshot: window chrome and lines of "text", different for each index
+    so the prepared-image cache does not hide the encoding cost.
+    """
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (2560, 1440), (245, 245, 245))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 2560, 60), fill=(40, 44, 52))
+    for line in range(60):
+        y = 100 + line * 21
+        draw.text((80, y), f"{index:04d} def handler_{line}(request): return process(request, option={line})", fill=(20, 20, 20))
+    return image
+
+
+class Recorder:
+    """
+    Collects latencies, errors, bytes uploaded and peak RSS per stage.
+    """
+
+    def __init__(self, server_url):
+        self.server_url = server_url
+        self.stages = {}
+
+    def server_stats(self):
+        with urllib.request.urlopen(f"{self.server_url}/_stats", timeout=5) as response:
+            return json.load(response)
+
+    def _stage(self, name):
+        return self.stages.setdefault(name, {"latencies": [], "errors": 0, "bytes_uploaded": 0, "rss_delta_mb": None})
+
+    def run(self, name, function, *args, **kwargs):
+        before = self.server_stats()
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        try:
+            result, failed = function(*args, **kwargs), False
+        except InstantGPTError:
+            result, failed = None, True
+        elapsed = time.perf_counter() - start
+        rss_after = current_rss_mb()
+        after = self.server_stats()
+
+        stage = self._stage(name)
+        stage["latencies"].append(elapsed)
+        if failed:
+            stage["errors"] += 1
+        stage["bytes_uploaded"] += sum(
+            endpoint["bytes_received"] for endpoint in after.values()
+        ) - sum(endpoint["bytes_received"] for endpoint in before.values())
+        if rss_before is not None and rss_after is not None:
+            # Largest growth over one call; the process-wide peak is only reported for the whole run
+            delta = rss_after - rss_before
+            stage["rss_delta_mb"] = delta if stage["rss_delta_mb"] is None else max(stage["rss_delta_mb"], delta)
+        return result
+
+    def record(self, name, elapsed):
+        stage = self._stage(name)
+        stage["latencies"].append(elapsed)
+
+    def summary(self):
+        summary = {}
+        for name, stage in self.stages.items():
+            latencies_ms = [latency * 1000 for latency in stage["latencies"]]
+            summary[name] = {
+                "count": len(latencies_ms),
+                "errors": stage["errors"],
+                "p50_ms": round(percentile(latencies_ms, 50), 2),
+                "p95_ms": round(percentile(latencies_ms, 95), 2),
+                "p99_ms": round(percentile(latencies_ms, 99), 2),
+                "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 2),
+                "bytes_uploaded": stage["bytes_uploaded"],
+                "rss_delta_mb": None if stage["rss_delta_mb"] is None else round(stage["rss_delta_mb"], 1),
+            }
+        return summary
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_fake_server(args):
+    """
+    Start the fake server in its own process so it does not share the GIL or
+    the memory measured for the client, and wait until it answers.
+    """
+    port = free_port()
+    command = [sys.executable, "-m", "benchmarks.fake_openai", "--port", str(port)]
+    for option, value in server_options(args).items():
+        command += [f"--{option.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{url}/_stats", timeout=1).close()
+            return process, url
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("The fake OpenAI server did not start.")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(args, server_url):
+    # Point the shared client at the fake server; must happen before the app modules are imported
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    os.environ["OPENAI_BASE_URL"] = f"{server_url}/v1"
+    os.environ["INSTANTGPT_CACHE"] = "0"
+    # Span logging and metrics would add their own time and memory to every stage
+    os.environ["INSTANTGPT_TELEMETRY"] = "0"
+
+    from utils.audio import split_audio_with_wave, split_audio_buffer, transcribe_audio_with_whisper
+    from utils.gpt_client import send_to_llm, send_image_to_gpt4o_with_transcript
+
+    recorder = Recorder(server_url)
+    workdir = tempfile.mkdtemp(prefix="instantgpt-bench-")
+    try:
+        fixtures = args.wav or [
+            write_speech_fixture(os.path.join(workdir, f"speech_{seconds:g}s.wav"), seconds)
+            for seconds in args.fixture_seconds
+        ]
+        for iteration in range(args.iterations):
+            for fixture in fixtures:
+                label = os.path.splitext(os.path.basename(fixture))[0]
+                chunk_paths = recorder.run(f"split_wave[{label}]", split_audio_with_wave, fixture)
+                for chunk_path in chunk_paths:
+                    recorder.run(f"transcribe_wav[{label}]", transcribe_audio_with_whisper, chunk_path)
+                    os.remove(chunk_path)
+
+                with wave.open(fixture, "rb") as wav_file:
+                    frames = wav_file.readframes(wav_file.getnframes())
+                uploads = recorder.run(f"prepare_upload[{label}]", split_audio_buffer, frames)
+                for upload in uploads:
+                    recorder.run(f"transcribe_upload[{label}]", transcribe_audio_with_whisper, upload)
+
+            prompt = f"Audio transcription:\nBenchmark request {iteration}: summarize the clipboard.\n"
+            recorder.run("chat", send_to_llm, prompt)
+
+            first_delta = []
+            start = time.perf_counter()
+            recorder.run("chat_stream", send_to_llm, prompt + " (streamed)",
+                         on_delta=lambda delta: first_delta or first_delta.append(time.perf_counter()))
+            if first_delta:
+                recorder.record("chat_stream_first_token", first_delta[0] - start)
+
+            recorder.run("vision", send_image_to_gpt4o_with_transcript, make_screenshot(iteration),
+                         f"Benchmark request {iteration}: what is on this screen?")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "iterations": args.iterations,
+        "fixtures": [os.path.basename(fixture) for fixture in args.wav] or [f"speech_{seconds:g}s.wav" for seconds in args.fixture_seconds],
+        "server": server_options(args),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stages": recorder.summary(),
+    }
+
+
+def print_report(results, baseline=None):
+    print(f"{'stage':40} {'n':>4} {'err':>4} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'uploaded':>12} {'rss +MB':>8}")
+    for name, stage in results["stages"].items():
+        line = (f"{name:40} {stage['count']:>4} {stage['errors']:>4} {stage['p50_ms']:>10.1f} "
+                f"{stage['p95_ms']:>10.1f} {stage['p99_ms']:>10.1f} {stage['bytes_uploaded']:>12} "
+                f"{'-' if stage['rss_delta_mb'] is None else stage['rss_delta_mb']:>8}")
+        previous = (baseline or {}).get("stages", {}).get(name)
+        if previous and previous["p50_ms"]:
+            change = (stage["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"] * 100
+            line += f"  p50 {change:+.1f}% vs {baseline['commit']}"
+        print(line)
+    print(f"Peak RSS: {results['peak_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="InstantGPT latency benchmark (offline)")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--wav", nargs="*", default=[], help="recorded WAV fixtures to use instead of synthetic ones")
+    parser.add_argument("--fixture-seconds", type=float, nargs="*", default=[10, 60], help="lengths of the synthetic WAV fixtures")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--base-url", help="use an already running fake server (without /v1) instead of starting one")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    process = None
+    if args.base_url:
+        server_url = args.base_url.rstrip("/")
+    else:
+        process, server_url = start_fake_server(args)
+    try:
+        results = run_benchmark(args, server_url)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(results, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,74 +1,79 @@
-import time 
-from ui.main_window import MainApp  # Import de la classe principale
-from utils.clipboard import process_clipboard_content  # Import des fonctions utilitaires
-from utils.audio import record_audio_until_space, split_audio_with_wave, transcribe_audio_with_whisper, OUTPUT_FILENAME
-from utils.gpt_client import send_image_to_gpt4o_with_transcript, send_to_llm
-
-import threading
-
-if __name__ == "__main__":
-    app = MainApp()
-
-    def run_main_operations():
-        app.start_timer()
-
-        # Step 1: Start recording
-        app.update_log("Recording started...")
-        start_time = time.time()
-        record_audio_until_space()
-        app.update_log("Recording stopped.")
-
-        # Step 2: Calculate the recording duration
-        elapsed_time = int(time.time() - start_time)
-        app.update_log(f"Total recording duration: {elapsed_time} seconds")
+import sys
+from utils.daemon import forward_to_daemon
 
-        # Step 3: Check clipboard content
-        app.update_log("Checking clipboard content...")
-        image_path, clipboard_content = process_clipboard_content()
+# A running daemon takes over this launch before any of the heavy imports below
+if __name__ == "__main__" and "--daemon" not in sys.argv:
+    if forward_to_daemon("quit" if "--quit" in sys.argv else "record"):
+        sys.exit(0)
 
-        if image_path:
-            app.update_log("Clipboard contains an image.")
-        elif clipboard_content:
-            app.update_log("Clipboard contains text.")
-        else:
-            app.update_log("Clipboard is empty or invalid.")
-
-        # Step 4: Split and Transcribe the audio
-        app.update_log("Splitting audio into chunks if necessary...")
-        chunks = split_audio_with_wave(OUTPUT_FILENAME)
-        app.update_log(f"Audio split into {len(chunks)} chunks.")
-
-        # Initialize the full transcription variable
-        full_transcription = []
-        for chunk in chunks:
-            app.update_log(f"Transcribing...")
-            transcription_text = transcribe_audio_with_whisper(chunk)
-            if "Error" in transcription_text:
-                app.update_log(f"Error during transcription of {chunk}: {transcription_text}")
-            else:
-                app.update_log(f"Transcription for {chunk} completed and added to full transcription.")
-                full_transcription.append(transcription_text)
-
-        combined_transcription = "\n".join(full_transcription)
-
-        # Ensure the combined transcription is passed correctly to the interface
-        if combined_transcription:
-            app.update_log("Combined transcription ready for display.")
+import queue
+import argparse
+import threading
+from ui.main_window import MainApp  # Import de la classe principale
+from utils.audio import warm_up_audio
+from utils.pipeline import Pipeline
+from utils.daemon import start_instance_server, start_hotkey_listener, DAEMON_MODE, DAEMON_PORT, HOTKEY
+from utils.telemetry import start_metrics_server
+
+
+def handle_daemon_command(app, pipeline, command):
+    """
+    Handle a command forwarded by another launch of the application.
+    """
+    if command == "record":
+        pipeline.submit()
+    elif command == "quit":
+        app.post(app.quit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="InstantGPT")
+    parser.add_argument("--daemon", action="store_true", help=f"stay resident in the background and record on {HOTKEY}")
+    parser.add_argument("--quit", action="store_true", help="stop the running daemon")
+    args = parser.parse_args()
+
+    if args.quit:
+        print("No InstantGPT daemon is running.")
+        return
+
+    daemon = args.daemon or DAEMON_MODE
+    if daemon:
+        # Take the single-instance lock before building anything; commands
+        # forwarded meanwhile wait in the queue until the window exists
+        commands = queue.Queue()
+        if start_instance_server(commands.put) is None:
+            print(f"Another InstantGPT instance (or another program) is using port {DAEMON_PORT}.")
+            return
+
+    start_metrics_server()
+    app = MainApp(daemon=daemon)
+    pipeline = Pipeline(app)
+
+    def on_close():
+        # Closing the window cancels the request in progress
+        pipeline.cancel()
+        if daemon:
+            app.hide_window()
         else:
-            app.update_log("No transcription available to display.")
-
-        # Step 5: Display clipboard inclusion options
-        app.update_log("Displaying transcription and clipboard content...")
+            app.destroy()
 
-        def handle_user_choice(include_clipboard):
-            # Show processing screen after the user's choice
-            app.handle_user_choice(include_clipboard, clipboard_content, combined_transcription, image_path)
+    app.protocol("WM_DELETE_WINDOW", on_close)
 
-        app.show_clipboard_prompt(clipboard_content, combined_transcription, image_path=image_path)
+    if daemon:
+        def dispatch_commands():
+            for command in iter(commands.get, None):
+                handle_daemon_command(app, pipeline, command)
 
-        # Bind the buttons to the processing logic
-        app.yes_button.configure(command=lambda: handle_user_choice(True))
-        app.no_button.configure(command=lambda: handle_user_choice(False))
+        threading.Thread(target=dispatch_commands, daemon=True).start()
+        # Keep PortAudio, the HTTP clients and the GIF frames warm between requests
+        warm_up_audio()
+        start_hotkey_listener(pipeline.submit)
+        print(f"InstantGPT is running in the background. Press {HOTKEY} to start recording.")
+    else:
+        pipeline.submit()
 
-    threading.Thread(target=run_main_operations, daemon=True).start()
     app.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import pytest
+from PIL import Image
+from utils import routing
+from utils.routing import choose_route, LatencyTracker, FAST_MODEL, STANDARD_MODEL, REASONING_MODEL, VISION_MODEL
+
+
+@pytest.fixture(autouse=True)
+def fresh_latencies(monkeypatch):
+    monkeypatch.setattr(routing, "latency_tracker", LatencyTracker())
+
+
+@pytest.mark.parametrize("transcript", [
+    "What do you think about this?",
+    "Can you prove me wrong?",
+    "I think this email is too long, can you shorten it?",
+    "Qu'en penses-tu ?",
+])
+def test_ordinary_questions_go_to_the_fast_model(transcript):
+    assert choose_route(transcript).model == FAST_MODEL
+
+
+@pytest.mark.parametrize("transcript", [
+    "Think step by step: which of these plans is cheaper?",
+    "Please reason carefully about this contract.",
+    "Explique-moi étape par étape.",
+])
+def test_explicit_phrases_select_the_reasoning_model(transcript):
+    route = choose_route(transcript)
+    assert route.model == REASONING_MODEL
+    assert route.fallback is None
+
+
+def test_code_goes_to_the_standard_model():
+    code = "def add(a, b):\n    return a + b\n\nclass Point:\n    pass\nimport os\n"
+    assert choose_route("What does this do?", clipboard_text=code).model == STANDARD_MODEL
+
+
+def test_images_go_to_the_vision_model():
+    assert choose_route("What is this?", image=Image.new("RGB", (10, 10))).model == VISION_MODEL
+
+
+def test_slow_model_is_stepped_down():
+    routing.latency_tracker.record(STANDARD_MODEL, routing.LATENCY_BUDGET_SECONDS + 5)
+    assert choose_route("x", clipboard_text="a" * (routing.LONG_PROMPT_CHARS + 1)).model == FAST_MODEL
@@ -0,0 +1,47 @@
+import json
+from utils import tokens
+from utils.tokens import truncate_head_tail, map_reduce, prepare_clipboard, count_tokens
+
+# Minified JSON: over a million characters on one line
+ONE_LINE = json.dumps([{"id": index, "value": "x" * 20} for index in range(30000)])
+
+
+def test_truncate_keeps_start_and_end_of_a_single_line():
+    truncated = truncate_head_tail(ONE_LINE, 6000)
+    assert truncated.startswith(ONE_LINE[:100])
+    assert truncated.endswith(ONE_LINE[-100:])
+    assert "characters omitted" in truncated
+    assert count_tokens(truncated) <= 6000 + 20  # The marker is not counted in the budget
+
+
+def test_truncate_cuts_a_long_line_between_short_ones():
+    text = "first\n" + "b" * 100000 + "\nlast"
+    truncated = truncate_head_tail(text, 100).splitlines()
+    assert truncated[0] == "first"
+    assert truncated[-1] == "last"
+    assert truncated[1].startswith("b") and truncated[-2].startswith("b")
+
+
+def test_truncate_leaves_text_within_budget_unchanged():
+    assert truncate_head_tail("short\ntext", 100) == "short\ntext"
+
+
+def test_map_reduce_receives_the_content_of_a_single_line(monkeypatch):
+    monkeypatch.setattr(tokens, "MAP_MAX_CHUNKS", 4)
+    chunks = []
+
+    def extract(chunk, question, index, total):
+        chunks.append(chunk)
+        return chunk[:10]
+
+    reduced, chunk_count = map_reduce(ONE_LINE, "question", extract)
+    assert chunk_count == len(chunks) <= 4
+    assert ONE_LINE[:1000] in "".join(chunks)
+    assert sum(len(chunk) for chunk in chunks) > 10000
+
+
+def test_truncate_and_dedupe_strategies_keep_a_single_line():
+    for strategy in ("truncate", "dedupe"):
+        reduced, note = prepare_clipboard(ONE_LINE, "question", None, budget=6000, strategy=strategy)
+        assert reduced.startswith(ONE_LINE[:100]), strategy
+        assert reduced.endswith(ONE_LINE[-100:]), strategy
@@ -0,0 +1,38 @@
+import numpy as np
+from utils.vad import find_pause, find_split_points
+
+RATE = 16000
+
+
+def tone(seconds, amplitude=3000):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.int16)
+
+
+def test_dip_between_syllables_is_not_a_pause():
+    samples = np.concatenate((tone(0.5), silence(0.08), tone(0.5)))
+    assert find_pause(samples, RATE, level=300) is None
+
+
+def test_sustained_quiet_run_is_a_pause():
+    samples = np.concatenate((tone(0.5), silence(0.4), tone(0.3)))
+    pause = find_pause(samples, RATE, level=300)
+    assert pause is not None
+    assert 0.5 * RATE < pause < 0.9 * RATE
+
+
+def test_the_last_pause_is_returned_for_stereo_input():
+    mono = np.concatenate((tone(0.3), silence(0.3), tone(0.3), silence(0.3), tone(0.1)))
+    pause = find_pause(np.stack((mono, mono), axis=1), RATE, level=300)
+    assert 1.2 * RATE > pause > 0.9 * RATE
+
+
+def test_split_point_lands_in_a_pause_at_the_end_of_the_samples():
+    # What split_audio_with_wave passes: exactly one chunk, one sample over the limit
+    samples = np.concatenate([np.concatenate((tone(0.9), silence(0.1))) for _ in range(6)])
+    (cut,) = find_split_points(samples, RATE, len(samples) - 1)
+    assert np.all(samples[cut - 100:cut + 100] == 0)
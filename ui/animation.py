@@ -0,0 +1,161 @@
+import os
+import sys
+import threading
+import customtkinter as ctk
+from PIL import Image, UnidentifiedImageError
+
+ANIMATION_TICK_MS = 100  # One GIF frame per tick; other tasks run every few ticks
+GIF_SIZE = (200, 200)
+
+
+def asset_path(name):
+    """
+    Path of a file in assets/, also when running from the PyInstaller bundle.
+    """
+    if hasattr(sys, '_MEIPASS'):
+        return os.path.join(sys._MEIPASS, 'assets', name)
+    return os.path.join(os.path.dirname(__file__), '..', 'assets', name)
+
+
+class FrameCache:
+    """
+    GIF frames decoded once per file and shared by every screen.
+
+    Decoding happens on a background thread (load), so the Tk loop never waits
+    for it; the decoded frames are wrapped in CTkImages on first use on the Tk
+    loop (get) and kept for the life of the application.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._decoded = {}  # path -> list of PIL images, or the decoding error
+        self._images = {}  # path -> list of CTkImages
+        self._loading = set()
+
+    def load(self, path):
+        """
+        Start decoding path in the background, unless it is already decoded or decoding.
+        """
+        with self._lock:
+            if path in self._decoded or path in self._loading:
+                return
+            self._loading.add(path)
+        threading.Thread(target=self._decode, args=(path,), daemon=True).start()
+
+    def _decode(self, path):
+        try:
+            with Image.open(path) as gif_image:
+                frames = []
+                for frame_index in range(getattr(gif_image, "n_frames", 1)):
+                    gif_image.seek(frame_index)
+                    # Stored at display size: full-size RGBA frames would take hundreds of MB
+                    frames.append(gif_image.convert("RGBA").resize(GIF_SIZE, Image.LANCZOS))
+        except (OSError, UnidentifiedImageError) as e:
+            frames = e
+        with self._lock:
+            self._decoded[path] = frames
+            self._loading.discard(path)
+
+    def get(self, path):
+        """
+        Return the CTkImages of path, None while it is still decoding.
+        Must be called on the Tk loop.
+
+        Raises:
+            OSError: If the GIF is missing or invalid.
+        """
+        images = self._images.get(path)
+        if images is not None:
+            return images
+        with self._lock:
+            decoded = self._decoded.get(path)
+        if decoded is None:
+            self.load(path)
+            return None
+        if isinstance(decoded, Exception):
+            raise decoded
+        images = self._images[path] = [ctk.CTkImage(light_image=frame, size=GIF_SIZE) for frame in decoded]
+        return images
+
+
+frame_cache = FrameCache()
+
+
+class Animator:
+    """
+    Single after() loop driving every animation of the window.
+
+    Each task belongs to a widget and only runs while that widget is viewable
+    (packed on the current screen, in a window that is not hidden). When no
+    task is viewable the loop stops, so a hidden or idle window costs no CPU;
+    wake() starts it again after a screen change or when the window is shown.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._tasks = {}  # name -> (widget, callback, every n ticks)
+        self._tick = 0
+        self._scheduled = None
+        # Any widget being mapped (window shown, screen packed) may make a task viewable again
+        root.bind("<Map>", lambda event: self.wake(), add="+")
+
+    def add(self, name, widget, callback, every_ms=ANIMATION_TICK_MS):
+        """
+        Run callback() every every_ms (rounded to ticks) while widget is viewable.
+        A task with the same name is replaced.
+        """
+        self._tasks[name] = (widget, callback, max(1, round(every_ms / ANIMATION_TICK_MS)))
+        self.wake()
+
+    def wake(self):
+        """
+        Start the loop if it is stopped. Safe to call as often as needed.
+        """
+        if self._scheduled is None and self._tasks:
+            self._scheduled = self.root.after_idle(self._run)
+
+    def _run(self):
+        self._scheduled = None
+        running = False
+        for name, (widget, callback, every) in list(self._tasks.items()):
+            if not widget.winfo_exists():
+                self._tasks.pop(name, None)
+                continue
+            if not widget.winfo_viewable():
+                continue
+            running = True
+            if self._tick % every == 0:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Animation {name} failed: {e}")
+                    self._tasks.pop(name, None)
+        self._tick += 1
+        if running:
+            self._scheduled = self.root.after(ANIMATION_TICK_MS, self._run)
+
+
+def gif_animation(label, path, on_error=None):
+    """
+    Return an Animator callback that shows the next frame of the GIF at path in
+    label on each call; frames come from the shared frame_cache.
+    on_error(message) is called once if the GIF is missing or invalid.
+    """
+    position = [0]
+    failed = [False]
+
+    def next_frame():
+        if failed[0]:
+            return
+        try:
+            frames = frame_cache.get(path)
+        except OSError:
+            failed[0] = True
+            if on_error:
+                on_error("Error: The GIF file is missing or invalid.")
+            return
+        if frames:
+            label.configure(image=frames[position[0] % len(frames)])
+            position[0] += 1
+
+    return next_frame
@@ -1,278 +1,207 @@
-import sys
-import os
-import time
+import queue
+import contextvars
 import customtkinter as ctk
-from utils.audio import record_audio_until_space, transcribe_audio_with_whisper
-from utils.gpt_client import send_to_llm, send_image_to_gpt4o_with_transcript
-from utils.clipboard import process_clipboard_content
-from PIL import Image, ImageTk, UnidentifiedImageError
-import threading
+from utils.telemetry import timed
+from ui.animation import Animator, frame_cache, asset_path
+from ui.screens import RecordingScreen, PromptScreen, ProcessingScreen, ResultScreen, RECORDING_GIF, PROCESSING_GIF
+
+RESPONSE_FLUSH_MS = 50  # How often streamed text is moved from the queue to the response box
+UI_POLL_MS = 20  # How often UI updates posted by other threads are applied
+UI_BATCH_SIZE = 50  # Maximum number of posted updates applied per poll
+TIMER_REFRESH_MS = 200  # How often the recording timer and level meter are refreshed
+LEVEL_FULL_SCALE = 8000  # Mean amplitude shown as a full level meter
 
 
 
 class MainApp(ctk.CTk):
-    def __init__(self):
+    def __init__(self, daemon=False):
         super().__init__()
         self.title("InstantGPT")
         self.geometry("600x700")
+        self.daemon = daemon
 
         # Set application icon
-        if hasattr(sys, '_MEIPASS'):
-            self.icon_path = os.path.join(sys._MEIPASS, 'assets', 'flash.ico')
-        else:
-            self.icon_path = os.path.join(os.path.dirname(__file__), '..', 'assets', 'flash.ico')
-
+        self.icon_path = asset_path('flash.ico')
         self.iconbitmap(self.icon_path)
 
-        if hasattr(sys, '_MEIPASS'):
-            self.gif_path = os.path.join(sys._MEIPASS, 'assets', 'recording.gif')
+        # Decode the GIFs in the background while the screens are built
+        frame_cache.load(RECORDING_GIF)
+        frame_cache.load(PROCESSING_GIF)
+
+        # UI updates posted by the pipeline thread, applied in batches on the Tk loop
+        self.ui_queue = queue.Queue()
+        self.after(UI_POLL_MS, self.drain_ui_queue)
+
+        # Streamed response text, filled from worker threads and drained on the Tk loop
+        self.response_queue = queue.Queue()
+        self.streamed_length = 0
+
+        # Every screen is built once; transitions only swap which one is packed
+        self.animator = Animator(self)
+        self.recording_screen = RecordingScreen(self, self.animator)
+        self.prompt_screen = PromptScreen(self)
+        self.processing_screen = ProcessingScreen(self, self.animator)
+        self.result_screen = ResultScreen(self, self.post)
+        self.current_screen = None
+
+        if daemon:
+            # Stay resident: start hidden and hide again instead of closing
+            self.withdraw()
+            self.protocol("WM_DELETE_WINDOW", self.hide_window)
         else:
-            self.gif_path = os.path.join(os.path.dirname(__file__), '..', 'assets', 'recording.gif')
+            # Initialize the animation window
+            self.show_screen(self.recording_screen)
 
-        # Initialize the animation window
-        self.init_recording_screen()
-
-    def update_log(self, log_message):
+    def show_screen(self, screen):
         """
-        Update the log label dynamically.
+        Replace the screen on display. Animations of hidden screens stop by themselves.
         """
-        self.recording_label.configure(text=log_message)
-        self.update_idletasks()  # Force immediate UI refresh
-
-
-    def init_recording_screen(self):
-        for widget in self.winfo_children():
-            widget.destroy()
-
-        # Log area (will update dynamically)
-        self.recording_label = ctk.CTkLabel(self, text="", font=("Helvetica", 16, "bold"), wraplength=500)
-        self.recording_label.pack(pady=10)
-
-        # Timer
-        self.chrono_label = ctk.CTkLabel(self, text="0:00", font=("Helvetica", 16))
-        self.chrono_label.pack(pady=5)
-
-        # GIF Animation
-        self.gif_label = ctk.CTkLabel(self, text="")
-        self.gif_label.pack(pady=10)
-        self.is_animating = True
-        self.start_gif_animation()
-
-        # Blinking text for stopping recording
-        self.stop_recording_label = ctk.CTkLabel(self, text="Press SPACE to stop recording", font=("Helvetica", 14))
-        self.stop_recording_label.pack(pady=10)
-        self.start_blinking_text()
-
-    def start_gif_animation(self):
-        try:
-            gif_image = Image.open(self.gif_path)
-            self.frames = []
-            for frame_index in range(gif_image.n_frames):
-                gif_image.seek(frame_index)
-                frame = ctk.CTkImage(light_image=gif_image.copy(), size=(200, 200))
-                self.frames.append(frame)
+        if screen is self.current_screen:
+            return
+        if self.current_screen is not None:
+            self.current_screen.pack_forget()
+        screen.pack(fill="both", expand=True)
+        self.current_screen = screen
+
+    def show_recording_screen(self):
+        """
+        Reset to the recording screen and bring the window to the front.
+        """
+        self.recording_screen.reset()
+        self.show_screen(self.recording_screen)
+        self.deiconify()
+        self.lift()
+        self.focus_force()
 
-            self.current_frame = 0
+    def hide_window(self):
+        """
+        Hide the window; the daemon keeps running in the background.
+        """
+        self.withdraw()
 
-            def update_frame():
-                if self.is_animating and self.gif_label.winfo_exists():
-                    self.gif_label.configure(image=self.frames[self.current_frame])
-                    self.current_frame = (self.current_frame + 1) % len(self.frames)
-                    self.after(100, update_frame)
+    def post(self, callback, *args):
+        """
+        Schedule callback(*args) on the Tk loop. Safe to call from any thread;
+        this is the only way other threads may touch the widgets. The callback runs
+        in the caller's context, so its timing spans join the caller's request.
+        """
+        self.ui_queue.put((contextvars.copy_context(), callback, args))
 
-            update_frame()
-        except (FileNotFoundError, UnidentifiedImageError):
-            self.recording_label.configure(text="Error: The GIF file is missing or invalid.")
+    def drain_ui_queue(self):
+        """
+        Apply up to UI_BATCH_SIZE posted updates, then reschedule itself.
+        """
+        for _ in range(UI_BATCH_SIZE):
+            try:
+                context, callback, args = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                context.run(callback, *args)
+            except Exception as e:
+                print(f"UI update {getattr(callback, '__name__', callback)} failed: {e}")
+        self.after(UI_POLL_MS, self.drain_ui_queue)
 
-    def start_blinking_text(self):
-        def toggle_visibility():
-            if self.stop_recording_label.winfo_exists():
-                current_color = self.stop_recording_label.cget("text_color")
-                new_color = "black" if current_color == "red" else "red"
-                self.stop_recording_label.configure(text_color=new_color)
-                self.after(500, toggle_visibility)    
-        toggle_visibility()
+    def update_log(self, log_message):
+        """
+        Update the log label dynamically.
+        """
+        self.recording_screen.log_label.configure(text=log_message)
+        self.update_idletasks()  # Force immediate UI refresh
 
-    
-    def start_timer(self):
-        self.start_time = time.time() 
-        start_time = time.time()
+    def start_timer(self, recording):
+        """
+        Show the duration and level of a RecordingBuffer while it fills, so the
+        timer matches the audio actually captured.
+        """
+        chrono_label, level_bar = self.recording_screen.chrono_label, self.recording_screen.level_bar
 
         def update_timer():
-            if self.chrono_label.winfo_exists():
-                elapsed_time = int(time.time() - start_time)
-                minutes = elapsed_time // 60
-                seconds = elapsed_time % 60
-                self.chrono_label.configure(text=f"{minutes}:{seconds:02}")
-                self.after(1000, update_timer)
-
-        update_timer()
-
-
-    def show_clipboard_prompt(self, clipboard_content, transcription_text, image_path):
-        # Clear old widgets
-        for widget in self.winfo_children():
-            widget.destroy()
-
-        # Prompt user for clipboard inclusion
-        self.prompt_label = ctk.CTkLabel(self, text="Do you want to include clipboard content in the request?", font=("Helvetica", 16, "bold"))
-        self.prompt_label.pack(pady=(50, 20))  # Ajustez le premier paramètre pour le centrer correctement
-
-        # Frame to hold buttons
-        button_frame = ctk.CTkFrame(self, fg_color=self.cget("fg_color"))  # Applique la couleur de fond pour harmoniser
-        button_frame.pack(pady=(20, 0))  # Descend le frame légèrement plus bas
+            elapsed_time = int(recording.duration)
+            minutes = elapsed_time // 60
+            seconds = elapsed_time % 60
+            chrono_label.configure(text=f"{minutes}:{seconds:02}")
+            level_bar.set(min(1.0, recording.level / LEVEL_FULL_SCALE))
 
-        self.yes_button = ctk.CTkButton(button_frame, text="Yes", command=lambda: self.handle_user_choice(True, clipboard_content, transcription_text, image_path))
-        self.yes_button.pack(side="left", padx=10)
+        # Replaces the previous recording's timer; runs only while the recording screen is shown
+        self.animator.add("timer", chrono_label, update_timer, TIMER_REFRESH_MS)
 
-        self.no_button = ctk.CTkButton(button_frame, text="No", command=lambda: self.handle_user_choice(False, clipboard_content, transcription_text, image_path))
-        self.no_button.pack(side="left", padx=10)
-
-    def process_request(self, include_clipboard, clipboard_content, transcription_text, image_path):
-        # Show processing screen
-        self.show_processing_screen()
-
-        # Prepare and send data to GPT-4o
-        transcription_text_with_context = f"The audio transcription contains the user's request: {transcription_text}"
-        if include_clipboard:
-            if image_path:
-                gpt_response = send_image_to_gpt4o_with_transcript(image_path, transcription_text_with_context)
-            else:
-                combined_prompt = (
-                    f"Clipboard content:\n{clipboard_content}\n\n"
-                    f"Audio transcription:\n{transcription_text_with_context}\n"
-                )
-                gpt_response = send_to_llm(combined_prompt)
-        else:
-            combined_prompt = (
-                f"Audio transcription:\n{transcription_text_with_context}\n"
-            )
-            gpt_response = send_to_llm(combined_prompt)
-
-        # Show results
-        self.show_result_screen(include_clipboard, clipboard_content, transcription_text, gpt_response, image_path)
+    @timed("render_prompt")
+    def show_clipboard_prompt(self, clipboard_content, transcription_text, image, on_choice):
+        """
+        Ask whether to include the clipboard; on_choice is called with True or False.
+        """
+        self.prompt_screen.ask(on_choice)
+        self.show_screen(self.prompt_screen)
 
     def show_processing_screen(self):
-        # Clear all previous widgets
-        for widget in self.winfo_children():
-            widget.destroy()
-
-        # Display the processing message
-        self.processing_label = ctk.CTkLabel(
-            self, 
-            text="Processing your request with OpenAI's LLM models...", 
-            font=("Helvetica", 16, "bold"), 
-            wraplength=500
-        )
-        self.processing_label.pack(pady=20)
-
-        # Add the GIF animation for processing
-        if hasattr(sys, '_MEIPASS'):
-            flash_gif_path = os.path.join(sys._MEIPASS, 'assets', 'flash.gif')
-        else:
-            flash_gif_path = os.path.join(os.path.dirname(__file__), '..', 'assets', 'flash.gif')
-
-        try:
-            gif_image = Image.open(flash_gif_path)
-            self.processing_frames = []
-            for frame_index in range(gif_image.n_frames):
-                gif_image.seek(frame_index)
-                frame = ctk.CTkImage(light_image=gif_image.copy(), size=(200, 200))
-                self.processing_frames.append(frame)
-
-            self.current_processing_frame = 0
-
-            self.processing_gif_label = ctk.CTkLabel(self, text="")
-            self.processing_gif_label.pack(pady=20)
-
-            def update_processing_frame():
-                if self.processing_gif_label.winfo_exists():
-                    self.processing_gif_label.configure(image=self.processing_frames[self.current_processing_frame])
-                    self.current_processing_frame = (self.current_processing_frame + 1) % len(self.processing_frames)
-                    self.after(100, update_processing_frame)
-
-            update_processing_frame()
-
-            # Force UI update to render changes immediately
-            self.update_idletasks()
-
-        except (FileNotFoundError, UnidentifiedImageError):
-            self.processing_label.configure(text="Error: The GIF file is missing or invalid.")
+        self.show_screen(self.processing_screen)
 
-
-    def handle_user_choice(self, include_clipboard, clipboard_content, transcription_text, image_path):
+    def start_response(self):
         """
-        Handle the user choice from the clipboard prompt and start processing.
+        Prepare for a new streamed response. Safe to call from any thread.
+
+        Returns:
+            tuple: (on_delta, on_done) callbacks for the request. on_delta queues
+            streamed text, on_done queues the full response once it is complete
+            (used to show errors, passed as exceptions, and responses that
+            were not streamed). Text from an earlier request goes to its own
+            queue and is never shown.
         """
-        # Show processing screen immediately
-        self.show_processing_screen()
-        self.update_idletasks()  # Force immediate UI update
-
-        def process_in_thread():
-            transcription_text_with_context = f"The audio transcription contains the user's request: {transcription_text}"
-            if include_clipboard:
-                if image_path:
-                    gpt_response = send_image_to_gpt4o_with_transcript(image_path, transcription_text_with_context)
-                else:
-                    combined_prompt = (
-                        f"Clipboard content:\n{clipboard_content}\n\n"
-                        f"Audio transcription:\n{transcription_text_with_context}\n"
-                    )
-                    gpt_response = send_to_llm(combined_prompt)
-            else:
-                combined_prompt = (
-                    f"Audio transcription:\n{transcription_text_with_context}\n"
-                )
-                gpt_response = send_to_llm(combined_prompt)
-
-            # Update UI with the results
-            self.show_result_screen(include_clipboard, clipboard_content, transcription_text, gpt_response, image_path)
-
-        # Run the processing in a separate thread
-        threading.Thread(target=process_in_thread, daemon=True).start()
-
-    def show_result_screen(self, include_clipboard, clipboard_content, transcription_text, gpt_response, image_path):
-        # Stop animation
-        self.is_animating = False
-
-        # Clear old widgets
-        for widget in self.winfo_children():
-            widget.destroy()
-
-        if include_clipboard:
-            # Display clipboard content if included
-            self.clipboard_label = ctk.CTkLabel(self, text="Clipboard Content", font=("Helvetica", 16, "bold"))
-            self.clipboard_label.pack(pady=5)
+        responses = queue.Queue()
+        self.response_queue = responses
+        return responses.put, lambda gpt_response: responses.put((gpt_response,))
 
-            if image_path:
-                # Display the image if detected
-                try:
-                    clipboard_image = Image.open(image_path)
-                    clipboard_image.thumbnail((400, 400))  # Resize the image
-                    clipboard_photo = ImageTk.PhotoImage(clipboard_image)
-
-                    self.clipboard_image_label = ctk.CTkLabel(self, image=clipboard_photo, text="")
-                    self.clipboard_image_label.image = clipboard_photo  # Prevent garbage collection
-                    self.clipboard_image_label.pack(pady=5)
-                except Exception as e:
-                    self.clipboard_text = ctk.CTkTextbox(self, width=580, height=150)
-                    self.clipboard_text.insert(ctk.END, f"Error displaying image: {e}")
-                    self.clipboard_text.pack(pady=5)
+    def flush_response_queue(self, responses):
+        """
+        Append all text queued in responses to the response box in one batch.
+        Runs on the Tk loop every RESPONSE_FLUSH_MS until the response is complete
+        or a newer response has started.
+        """
+        if responses is not self.response_queue:
+            return
+
+        parts = []
+        finished = None
+        while finished is None:
+            try:
+                item = responses.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, tuple):
+                finished = item[0]
             else:
-                self.clipboard_text = ctk.CTkTextbox(self, width=580, height=150)
-                self.clipboard_text.insert(ctk.END, clipboard_content)
-                self.clipboard_text.pack(pady=5)
-
-        self.transcript_label = ctk.CTkLabel(self, text="Transcript", font=("Helvetica", 16, "bold"))
-        self.transcript_label.pack(pady=5)
-        self.transcript_text = ctk.CTkTextbox(self, width=580, height=150)
-        self.transcript_text.pack(pady=5)
-        self.transcript_text.insert(ctk.END, transcription_text)
-
-        self.response_label = ctk.CTkLabel(self, text="ChatGPT Response", font=("Helvetica", 16, "bold"))
-        self.response_label.pack(pady=5)
-
-        # Display plain text response
-        self.response_text = ctk.CTkTextbox(self, width=580, height=200, wrap="word")
-        self.response_text.pack(pady=5)
-        self.response_text.insert(ctk.END, gpt_response)
+                parts.append(item)
+
+        if parts:
+            self.streamed_length += sum(len(part) for part in parts)
+            self.result_screen.append_response("".join(parts))
+
+        if finished is None:
+            self.after(RESPONSE_FLUSH_MS, self.flush_response_queue, responses)
+            return
+
+        if isinstance(finished, Exception):
+            self.result_screen.show_error(f"Error: {finished}")
+        elif not self.streamed_length:
+            self.result_screen.append_response(finished)
+        self.result_screen.finish_response()
+
+    @timed("render_result")
+    def show_result_screen(self, include_clipboard, clipboard_content, transcription_text, gpt_response, image, streaming=False,
+                           clipboard_note=None):
+        self.result_screen.show(include_clipboard, clipboard_content, transcription_text, gpt_response, image, streaming,
+                                clipboard_note)
+        self.show_screen(self.result_screen)
+
+        if streaming:
+            # Text arrives through the queue returned by start_response
+            self.streamed_length = 0
+            self.flush_response_queue(self.response_queue)
+
+    def show_timings(self, summary):
+        """
+        Show the per-stage timing breakdown of the request under the response.
+        """
+        if summary and self.current_screen is self.result_screen:
+            self.result_screen.show_timings(summary)
@@ -0,0 +1,176 @@
+import re
+from collections import deque
+from utils.config import env_flag, env_int
+
+# Large text is inserted a chunk per idle callback, so the window keeps responding
+RENDER_CHUNK_CHARS = env_int("INSTANTGPT_RENDER_CHUNK_CHARS", 8000)
+LAZY_PREVIEW_CHARS = env_int("INSTANTGPT_LAZY_PREVIEW_CHARS", 20000)  # Clipboard text shown before scrolling down
+LAZY_LOAD_AT = 0.9  # Load more once the view is this far down the loaded text
+HIGHLIGHT_RESPONSES = env_flag("INSTANTGPT_HIGHLIGHT", True)
+HIGHLIGHT_MAX_CHARS = 500_000  # Larger responses are left plain
+TAGS_PER_CALLBACK = 300
+
+# Markdown, matched on the full response
+FENCED_CODE = re.compile(r"^```[^\n]*\n.*?^```[ \t]*$", re.MULTILINE | re.DOTALL)
+INLINE_CODE = re.compile(r"`[^`\n]+`")
+HEADING = re.compile(r"^#{1,6} [^\n]*$", re.MULTILINE)
+BOLD = re.compile(r"\*\*[^*\n]+\*\*")
+# Tokens inside fenced code, common to most languages
+CODE_TOKENS = re.compile(
+    r"(?P<comment>#[^\n]*|//[^\n]*|--[^\n]*)"
+    r"|(?P<string>\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*')"
+    r"|\b(?P<keyword>def|class|return|if|elif|else|for|while|import|from|function|const|let|var|public|private|"
+    r"static|void|try|except|catch|finally|with|as|in|not|and|or|None|null|true|false|True|False|"
+    r"SELECT|FROM|WHERE|JOIN|INSERT|UPDATE|DELETE)\b"
+)
+
+TAG_COLORS = {
+    "Light": {"code": {"background": "#ececec"}, "heading": {"foreground": "#1f5fa8"}, "bold": {"foreground": "#000000"},
+              "keyword": {"foreground": "#a626a4"}, "string": {"foreground": "#50a14f"}, "comment": {"foreground": "#8a8a8a"}},
+    "Dark": {"code": {"background": "#2b2b2b"}, "heading": {"foreground": "#6cb6ff"}, "bold": {"foreground": "#ffffff"},
+             "keyword": {"foreground": "#c678dd"}, "string": {"foreground": "#98c379"}, "comment": {"foreground": "#7f848e"}},
+}
+
+
+def highlight_spans(text):
+    """
+    Find the markdown and code ranges of text, as (tag, start, end) character offsets.
+    Pure Python and thread-safe: meant to run off the Tk loop.
+    """
+    if len(text) > HIGHLIGHT_MAX_CHARS:
+        return []
+    spans = []
+    code_ranges = []
+    for block in FENCED_CODE.finditer(text):
+        spans.append(("code", block.start(), block.end()))
+        code_ranges.append((block.start(), block.end()))
+        for token in CODE_TOKENS.finditer(text, block.start(), block.end()):
+            spans.append((token.lastgroup, token.start(), token.end()))
+
+    def outside_code(match):
+        return not any(start <= match.start() < end for start, end in code_ranges)
+
+    for pattern, tag in ((INLINE_CODE, "code"), (HEADING, "heading"), (BOLD, "bold")):
+        spans.extend((tag, match.start(), match.end()) for match in pattern.finditer(text) if outside_code(match))
+    return spans
+
+
+class ChunkedWriter:
+    """
+    Appends text to a textbox RENDER_CHUNK_CHARS at a time, one chunk per idle
+    callback, so inserting a large response never blocks the Tk loop for long.
+    Text written while earlier chunks are pending is queued behind them.
+    """
+
+    def __init__(self, textbox):
+        self.textbox = textbox
+        self._pending = deque()
+        self._scheduled = None
+        self._on_drained = []
+
+    @property
+    def busy(self):
+        return bool(self._pending)
+
+    def write(self, text):
+        for start in range(0, len(text), RENDER_CHUNK_CHARS):
+            self._pending.append(text[start:start + RENDER_CHUNK_CHARS])
+        self._schedule()
+
+    def when_drained(self, callback):
+        """
+        Call callback once everything written so far has been inserted.
+        """
+        if self._pending:
+            self._on_drained.append(callback)
+        else:
+            callback()
+
+    def reset(self):
+        """
+        Drop pending text and clear the textbox.
+        """
+        self._pending.clear()
+        self._on_drained = []
+        self.textbox.delete("1.0", "end")
+
+    def _schedule(self):
+        if self._scheduled is None and self._pending:
+            self._scheduled = self.textbox.after_idle(self._insert_next)
+
+    def _insert_next(self):
+        self._scheduled = None
+        if not self.textbox.winfo_exists():
+            return
+        if self._pending:
+            self.textbox.insert("end", self._pending.popleft())
+        if self._pending:
+            # A timer rather than another idle callback, so input and redraws get in between
+            self._scheduled = self.textbox.after(1, self._insert_next)
+            return
+        callbacks, self._on_drained = self._on_drained, []
+        for callback in callbacks:
+            callback()
+
+
+class LazyText:
+    """
+    Shows long text in a textbox progressively: the first LAZY_PREVIEW_CHARS
+    are inserted, and the next part is appended whenever the view is scrolled
+    close to the end of what is loaded.
+    """
+
+    def __init__(self, textbox):
+        self.textbox = textbox
+        self.writer = ChunkedWriter(textbox)
+        self._text = ""
+        self._loaded = 0
+        # Chain our check after the textbox's own scrollbar update
+        self._scrollbar_command = textbox.cget("yscrollcommand")
+        textbox.configure(yscrollcommand=self._on_scroll)
+
+    def set_text(self, text):
+        self.writer.reset()
+        self._text = text or ""
+        self._loaded = 0
+        self._load_more()
+
+    def _load_more(self):
+        end = min(len(self._text), self._loaded + LAZY_PREVIEW_CHARS)
+        if end > self._loaded:
+            self.writer.write(self._text[self._loaded:end])
+            self._loaded = end
+
+    def _on_scroll(self, first, last):
+        if self._scrollbar_command:
+            self.textbox.tk.call(self._scrollbar_command, first, last)
+        if float(last) >= LAZY_LOAD_AT and self._loaded < len(self._text) and not self.writer.busy:
+            self._load_more()
+
+
+def configure_tags(textbox, appearance_mode):
+    for tag, options in TAG_COLORS.get(appearance_mode, TAG_COLORS["Light"]).items():
+        textbox.tag_config(tag, **options)
+    # Tokens win over the code block background they sit in
+    for tag in ("keyword", "string", "comment"):
+        textbox.tag_raise(tag)
+
+
+def apply_spans(textbox, spans, is_current=lambda: True):
+    """
+    Add the tags found by highlight_spans, TAGS_PER_CALLBACK at a time on idle
+    callbacks. Stops if is_current() turns false (the text was replaced).
+    """
+    pending = deque(spans)
+
+    def apply_next():
+        if not is_current() or not textbox.winfo_exists():
+            return
+        for _ in range(min(TAGS_PER_CALLBACK, len(pending))):
+            tag, start, end = pending.popleft()
+            textbox.tag_add(tag, f"1.0+{start}c", f"1.0+{end}c")
+        if pending:
+            textbox.after(1, apply_next)
+
+    if pending:
+        textbox.after_idle(apply_next)
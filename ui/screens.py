@@ -0,0 +1,255 @@
+import threading
+import pyperclip
+import customtkinter as ctk
+from ui.animation import gif_animation, asset_path
+from ui.rendering import ChunkedWriter, LazyText, highlight_spans, configure_tags, apply_spans, HIGHLIGHT_RESPONSES
+
+BLINK_MS = 500  # Blinking of the "Press SPACE" hint
+COPIED_FEEDBACK_MS = 1500
+RECORDING_GIF = asset_path('recording.gif')
+PROCESSING_GIF = asset_path('flash.gif')
+
+
+class Screen(ctk.CTkFrame):
+    """
+    One page of the window. Screens are built once and swapped with MainApp.show_screen;
+    showing one again only updates its content, no widget is recreated.
+    """
+
+    def __init__(self, master):
+        super().__init__(master, fg_color="transparent")
+
+
+class RecordingScreen(Screen):
+    def __init__(self, master, animator):
+        super().__init__(master)
+
+        # Log area (will update dynamically)
+        self.log_label = ctk.CTkLabel(self, text="", font=("Helvetica", 16, "bold"), wraplength=500)
+        self.log_label.pack(pady=10)
+
+        # Timer
+        self.chrono_label = ctk.CTkLabel(self, text="0:00", font=("Helvetica", 16))
+        self.chrono_label.pack(pady=5)
+
+        # Microphone level
+        self.level_bar = ctk.CTkProgressBar(self, width=200)
+        self.level_bar.set(0)
+        self.level_bar.pack(pady=5)
+
+        # GIF Animation
+        self.gif_label = ctk.CTkLabel(self, text="")
+        self.gif_label.pack(pady=10)
+        animator.add("recording_gif", self.gif_label,
+                     gif_animation(self.gif_label, RECORDING_GIF, lambda message: self.log_label.configure(text=message)))
+
+        # Blinking text for stopping recording
+        self.stop_recording_label = ctk.CTkLabel(self, text="Press SPACE to stop recording", font=("Helvetica", 14))
+        self.stop_recording_label.pack(pady=10)
+        animator.add("blink", self.stop_recording_label, self.toggle_stop_label, BLINK_MS)
+
+    def toggle_stop_label(self):
+        current_color = self.stop_recording_label.cget("text_color")
+        self.stop_recording_label.configure(text_color="black" if current_color == "red" else "red")
+
+    def reset(self):
+        self.log_label.configure(text="")
+        self.chrono_label.configure(text="0:00")
+        self.level_bar.set(0)
+
+
+class PromptScreen(Screen):
+    def __init__(self, master):
+        super().__init__(master)
+        self.on_choice = None
+
+        # Prompt user for clipboard inclusion
+        self.prompt_label = ctk.CTkLabel(self, text="Do you want to include clipboard content in the request?", font=("Helvetica", 16, "bold"))
+        self.prompt_label.pack(pady=(50, 20))  # Ajustez le premier paramètre pour le centrer correctement
+
+        # Frame to hold buttons
+        button_frame = ctk.CTkFrame(self, fg_color=self.cget("fg_color"))  # Applique la couleur de fond pour harmoniser
+        button_frame.pack(pady=(20, 0))  # Descend le frame légèrement plus bas
+
+        self.yes_button = ctk.CTkButton(button_frame, text="Yes", command=lambda: self.choose(True))
+        self.yes_button.pack(side="left", padx=10)
+
+        self.no_button = ctk.CTkButton(button_frame, text="No", command=lambda: self.choose(False))
+        self.no_button.pack(side="left", padx=10)
+
+    def ask(self, on_choice):
+        """
+        Enable the buttons for a new question; on_choice is called with True or False.
+        """
+        self.on_choice = on_choice
+        self.yes_button.configure(state="normal")
+        self.no_button.configure(state="normal")
+
+    def choose(self, include_clipboard):
+        self.yes_button.configure(state="disabled")
+        self.no_button.configure(state="disabled")
+        if self.on_choice:
+            self.on_choice(include_clipboard)
+
+
+class ProcessingScreen(Screen):
+    def __init__(self, master, animator):
+        super().__init__(master)
+
+        # Display the processing message
+        self.processing_label = ctk.CTkLabel(
+            self,
+            text="Processing your request with OpenAI's LLM models...",
+            font=("Helvetica", 16, "bold"),
+            wraplength=500
+        )
+        self.processing_label.pack(pady=20)
+
+        # GIF animation for processing
+        self.processing_gif_label = ctk.CTkLabel(self, text="")
+        self.processing_gif_label.pack(pady=20)
+        animator.add("processing_gif", self.processing_gif_label,
+                     gif_animation(self.processing_gif_label, PROCESSING_GIF,
+                                   lambda message: self.processing_label.configure(text=message)))
+
+
+class ResultScreen(Screen):
+    """
+    Clipboard, transcript and response of the last request.
+
+    Text is never inserted in one call: the response and transcript go through
+    a ChunkedWriter, and clipboard text is loaded as it is scrolled to (LazyText).
+    The full response is also kept as a string for the copy button, so copying
+    never reads megabytes back out of the widget. post is MainApp.post, used to
+    return highlighting computed on a worker thread to the Tk loop.
+    """
+
+    def __init__(self, master, post):
+        super().__init__(master)
+        self.post = post
+        self.response_parts = []
+        self._generation = 0  # Bumped for each new response; stale highlighting is dropped
+
+        self.clipboard_label = ctk.CTkLabel(self, text="Clipboard Content", font=("Helvetica", 16, "bold"))
+        # How oversized clipboard text was reduced before it was sent
+        self.clipboard_note_label = ctk.CTkLabel(self, text="", font=("Helvetica", 12), text_color="gray", wraplength=580)
+        self.clipboard_image_label = ctk.CTkLabel(self, text="")
+        self.clipboard_text = ctk.CTkTextbox(self, width=580, height=150)
+        self.clipboard_view = LazyText(self.clipboard_text)
+
+        self.transcript_label = ctk.CTkLabel(self, text="Transcript", font=("Helvetica", 16, "bold"))
+        self.transcript_text = ctk.CTkTextbox(self, width=580, height=150)
+        self.transcript_writer = ChunkedWriter(self.transcript_text)
+
+        # Title row with the copy button
+        response_header = ctk.CTkFrame(self, fg_color="transparent")
+        self.response_header = response_header
+        self.response_label = ctk.CTkLabel(response_header, text="ChatGPT Response", font=("Helvetica", 16, "bold"))
+        self.response_label.pack(side="left", padx=10)
+        self.copy_button = ctk.CTkButton(response_header, text="Copy response", width=120, command=self.copy_response)
+        self.copy_button.pack(side="left", padx=10)
+        # Display plain text response
+        self.response_text = ctk.CTkTextbox(self, width=580, height=200, wrap="word")
+        self.response_writer = ChunkedWriter(self.response_text)
+        configure_tags(self.response_text, ctk.get_appearance_mode())
+
+        self.timings_label = ctk.CTkLabel(self, text="", font=("Helvetica", 11), text_color="gray", wraplength=580)
+
+    def show(self, include_clipboard, clipboard_content, transcription_text, gpt_response, image, streaming=False,
+             clipboard_note=None):
+        """
+        Fill the screen for a new result, packing only the parts it needs.
+        With streaming, the response is added afterwards with append_response and finish_response.
+        """
+        for widget in self.pack_slaves():
+            widget.pack_forget()
+
+        if include_clipboard:
+            # Display clipboard content if included
+            self.clipboard_label.pack(pady=5)
+
+            if clipboard_note:
+                self.clipboard_note_label.configure(text=clipboard_note)
+                self.clipboard_note_label.pack()
+
+            if image:
+                # Display the image if detected
+                try:
+                    clipboard_image = image.copy()
+                    clipboard_image.thumbnail((400, 400))  # Resize the image
+                    clipboard_photo = ctk.CTkImage(light_image=clipboard_image, size=clipboard_image.size)
+                    self.clipboard_image_label.configure(image=clipboard_photo)
+                    self.clipboard_image_label.pack(pady=5)
+                except Exception as e:
+                    self.clipboard_view.set_text(f"Error displaying image: {e}")
+                    self.clipboard_text.pack(pady=5)
+            else:
+                self.clipboard_view.set_text(clipboard_content)
+                self.clipboard_text.pack(pady=5)
+
+        self.transcript_label.pack(pady=5)
+        self.transcript_text.pack(pady=5)
+        self.transcript_writer.reset()
+        self.transcript_writer.write(transcription_text or "")
+
+        response_title = "ChatGPT Response (generating...)" if streaming else "ChatGPT Response"
+        self.response_label.configure(text=response_title)
+        self.copy_button.configure(text="Copy response", state="disabled" if streaming else "normal")
+        self.response_header.pack(pady=5)
+        self.response_text.pack(pady=5)
+        self._generation += 1
+        self.response_parts = []
+        self.response_writer.reset()
+        if not streaming:
+            self.append_response(gpt_response or "")
+            self.finish_response()
+
+    def append_response(self, text):
+        self.response_parts.append(text)
+        self.response_writer.write(text)
+
+    def show_error(self, error_text):
+        """
+        Show an error after the response text; it is not part of what the copy button copies.
+        """
+        self.response_writer.write(f"\n\n{error_text}" if self.response_parts else error_text)
+
+    def finish_response(self):
+        """
+        Mark the response complete: enable copying and, once the text is in the
+        widget, highlight it from a worker thread.
+        """
+        self.response_label.configure(text="ChatGPT Response")
+        self.copy_button.configure(state="normal")
+        if HIGHLIGHT_RESPONSES:
+            self.response_writer.when_drained(self._highlight)
+
+    def _highlight(self):
+        generation = self._generation
+        text = "".join(self.response_parts)
+
+        def is_current():
+            return generation == self._generation
+
+        def compute():
+            spans = highlight_spans(text)
+            if spans:
+                self.post(apply_spans, self.response_text, spans, is_current)
+
+        threading.Thread(target=compute, daemon=True).start()
+
+    def copy_response(self):
+        """
+        Copy the full response to the clipboard, from the string kept in memory.
+        """
+        text = "".join(self.response_parts)
+        if not text:
+            return
+        # Some clipboard backends run a subprocess; keep it off the Tk loop
+        threading.Thread(target=pyperclip.copy, args=(text,), daemon=True).start()
+        self.copy_button.configure(text="Copied")
+        self.after(COPIED_FEEDBACK_MS, lambda: self.copy_button.configure(text="Copy response"))
+
+    def show_timings(self, summary):
+        self.timings_label.configure(text=summary)
+        self.timings_label.pack(pady=(0, 5))
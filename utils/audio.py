@@ -1,120 +1,496 @@
 import wave
-import pyaudio
-from pynput import keyboard
-from openai import OpenAI
-from dotenv import load_dotenv
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import io
 import os
-
-# Load the OpenAI API key from the .env file
-load_dotenv()
-
-# Initialize the OpenAI client with the API key
-api_key = os.getenv("OPENAI_API_KEY")
-if api_key is None:
-    raise ValueError("API key not found. Make sure OPENAI_API_KEY is set in your .env file.")
-client = OpenAI(api_key=api_key)
+import hashlib
+import numpy as np
+from utils.config import env_flag, env_int, env_float
+from utils.cache import response_cache, make_key
+from utils.openai_client import client, request_timeout
+from utils.errors import InstantGPTError
+from utils.resilience import Deadline, call_with_retries, TRANSCRIPTION_DEADLINE, HEDGE_REQUESTS
+from utils.wav import WavPayload, WAV_HEADER_SIZE
+from utils.capture import RecordingBuffer
+from utils.telemetry import span, count, propagate
+from utils.vad import compact_speech, find_split_points, find_pause, TRIM_SILENCE, MIN_PAUSE_SECONDS
+from utils.encoding import convert_pcm, encode_audio, UPLOAD_CHANNELS, UPLOAD_RATE
 
 # Enhanced audio parameters
 CHUNK = 512  # Smaller chunk size for reduced latency
-FORMAT = pyaudio.paInt16  # 16-bit audio format
+SAMPLE_WIDTH = 2  # 16-bit audio format (pyaudio.paInt16)
 CHANNELS = 2  # Stereo
 RATE = 48000  # Higher sampling rate
 OUTPUT_FILENAME = "output.wav"
+MAX_UPLOAD_MB = 24  # Stay under the 25 MB limit of the transcription API
+TRANSCRIPTION_MODEL = "whisper-1"
+
+# Recordings stay in memory; set this to also write them to OUTPUT_FILENAME for debugging
+SAVE_RECORDING = env_flag("INSTANTGPT_SAVE_RECORDING", False)
+
+# Streaming transcription: segments are cut and transcribed while recording
+STREAMING_TRANSCRIPTION = env_flag("INSTANTGPT_STREAMING", True)
+SEGMENT_SECONDS = env_float("INSTANTGPT_SEGMENT_SECONDS", 15)  # Cut at the next pause after this
+MAX_SEGMENT_SECONDS = env_float("INSTANTGPT_MAX_SEGMENT_SECONDS", 30)  # Cut here even without a pause
+SILENCE_LEVEL = env_int("INSTANTGPT_SILENCE_LEVEL", 300)  # RMS below which the audio counts as a pause
+SEGMENT_POLL_SECONDS = 0.05  # How often the streaming recorder checks whether to cut a segment
+TRANSCRIPTION_WORKERS = env_int("INSTANTGPT_TRANSCRIPTION_WORKERS", 4)  # Concurrent uploads
+TRANSCRIPTION_RETRIES = env_int("INSTANTGPT_TRANSCRIPTION_RETRIES", 2)  # Extra attempts per chunk
+
+
+# PortAudio instance and input stream kept open between recordings by warm_up_audio
+_warm_audio = None
+_warm_stream = None
+
+# Buffer the PortAudio callback currently writes to (one recording at a time)
+_capture_buffer = None
+
+
+def _capture_callback(in_data, frame_count, time_info, status):
+    """
+    PortAudio callback: hand each block to the active recording buffer.
+    """
+    import pyaudio  # Already loaded by the stream that calls back
+
+    recording = _capture_buffer
+    if recording is not None:
+        recording.write(in_data, overflowed=bool(status & pyaudio.paInputOverflow))
+    return (None, pyaudio.paContinue)
+
+
+def new_recording_buffer(stop_event=None):
+    """
+    Create a RecordingBuffer for the recording parameters above.
+    """
+    return RecordingBuffer(CHANNELS, RATE, SAMPLE_WIDTH, stop_event=stop_event)
+
+
+def warm_up_audio():
+    """
+    Initialize PortAudio and open the microphone stream once, stopped, so that
+    later recordings only have to start it. Used by the resident daemon mode.
+    """
+    import pyaudio
+
+    global _warm_audio, _warm_stream
+    if _warm_audio is None:
+        _warm_audio = pyaudio.PyAudio()
+        _warm_stream = _warm_audio.open(format=pyaudio.paInt16,
+                                        channels=CHANNELS,
+                                        rate=RATE,
+                                        input=True,
+                                        frames_per_buffer=CHUNK,
+                                        stream_callback=_capture_callback,
+                                        start=False)
 
-def record_audio_until_space(output_filename=OUTPUT_FILENAME):
+
+def _open_input_stream(recording):
     """
-    Record audio until the user presses SPACE with improved quality.
+    Start capturing into a RecordingBuffer with the recording parameters above,
+    reusing the warm stream if warm_up_audio was called.
     """
+    # Imported here so that the transcription helpers also load without PortAudio (benchmarks, batch mode)
+    import pyaudio
+
+    global _capture_buffer
+    _capture_buffer = recording
+    if _warm_stream is not None:
+        _warm_stream.start_stream()
+        return _warm_audio, _warm_stream
+
     audio = pyaudio.PyAudio()
-    stream = audio.open(format=FORMAT, 
+    stream = audio.open(format=pyaudio.paInt16,
                         channels=CHANNELS,
                         rate=RATE,
                         input=True,
-                        frames_per_buffer=CHUNK)
+                        frames_per_buffer=CHUNK,
+                        stream_callback=_capture_callback)
+    return audio, stream
+
+
+def _close_input_stream(audio, stream):
+    """
+    Stop the microphone, keeping the warm stream open for the next recording.
+    """
+    global _capture_buffer
+    stream.stop_stream()
+    _capture_buffer = None
+    if stream is not _warm_stream:
+        stream.close()
+        audio.terminate()
+
 
-    frames = []
-    stop_recording = False
+def _start_space_listener(stop_recording=None):
+    """
+    Start a keyboard listener and return it with an event set when SPACE is pressed.
+    An existing event can be passed so that the caller can also stop the recording.
+    """
+    # Imported here so that the transcription helpers also load on headless machines (benchmarks)
+    from pynput import keyboard
+
+    stop_recording = stop_recording or threading.Event()
 
     def on_press(key):
-        nonlocal stop_recording
         if key == keyboard.Key.space:
-            stop_recording = True
+            stop_recording.set()
             return False
 
     listener = keyboard.Listener(on_press=on_press)
     listener.start()
+    return listener, stop_recording
+
+
+def make_payload(frames, name="audio.wav"):
+    """
+    Wrap PCM frames recorded with the parameters above into an upload-ready WAV payload.
+    """
+    return WavPayload(frames, CHANNELS, RATE, SAMPLE_WIDTH, name=name)
+
+
+def prepare_upload(frames, name="audio"):
+    """
+    Downmix, resample, trim silence from and encode raw PCM frames into the
+    configured upload format. Returns None if the frames contain no speech.
+    """
+    with span("encode", seconds=round(len(frames) / (RATE * CHANNELS * SAMPLE_WIDTH), 1)):
+        samples = convert_pcm(frames, CHANNELS, RATE)
+        if TRIM_SILENCE:
+            samples = compact_speech(samples, UPLOAD_RATE)
+        if not len(samples):
+            return None
+        return encode_audio(samples, name=name)
+
+
+def record_audio_until_space(output_filename=None, stop_event=None, recording=None):
+    """
+    Record audio until the user presses SPACE (or stop_event is set) with improved quality.
+
+    PortAudio delivers the audio through a callback into a RecordingBuffer, which
+    also stops the recording at its duration or memory limit. The frames are
+    returned without copying; the recording is only written to disk if
+    output_filename is given or SAVE_RECORDING is set.
+
+    Args:
+        output_filename (str): Optional path to also save the recording to.
+        stop_event (threading.Event): Optional event that also stops the recording.
+        recording (RecordingBuffer): Optional buffer to record into, e.g. one the UI reads its timer from.
+    Returns:
+        memoryview: The raw PCM frames.
+    """
+    recording = recording or new_recording_buffer(stop_event)
+    listener, stop_recording = _start_space_listener(recording.stop_event)
+    audio, stream = _open_input_stream(recording)
 
     print("Recording... Press SPACE to stop.")
-    while not stop_recording:
-        data = stream.read(CHUNK, exception_on_overflow=False)
-        frames.append(data)
+    try:
+        stop_recording.wait()
+    finally:
+        listener.stop()
+        _close_input_stream(audio, stream)
+    print(f"Recording stats: {recording.stats()}")
 
-    listener.stop()
-    stream.stop_stream()
-    stream.close()
-    audio.terminate()
+    frames = recording.frames()
+    if output_filename or SAVE_RECORDING:
+        make_payload(frames).save(output_filename or OUTPUT_FILENAME)
+        print(f"Recording saved to {output_filename or OUTPUT_FILENAME}")
 
-    with wave.open(output_filename, 'wb') as wf:
-        wf.setnchannels(CHANNELS)
-        wf.setsampwidth(audio.get_sample_size(FORMAT))
-        wf.setframerate(RATE)
-        wf.writeframes(b''.join(frames))
+    return frames
 
-    print(f"Recording saved to {output_filename}")
 
-def transcribe_audio_with_whisper(filename=OUTPUT_FILENAME):
+def record_audio_streaming(transcribe=None, stop_event=None, recording=None):
     """
-    Use OpenAI's Whisper API to transcribe the audio file.
-    Returns the transcription as text.
+    Record audio until the user presses SPACE (or stop_event is set), transcribing
+    it segment by segment while the recording is still running.
+
+    A segment is cut in the first pause of at least MIN_PAUSE_SECONDS (find_pause)
+    once it is SEGMENT_SECONDS long. Without such a pause it is cut at
+    MAX_SEGMENT_SECONDS, at the quietest moment of its last seconds (find_split_points).
+    The recording buffer is checked every SEGMENT_POLL_SECONDS while the PortAudio
+    callback fills it. Each segment is copied out of the buffer and submitted to a background worker, which encodes it with
+    prepare_upload and transcribes it, so when SPACE is pressed only the last
+    segment is left to transcribe. The full recording is written to OUTPUT_FILENAME only if
+    SAVE_RECORDING is set.
+
+    Args:
+        transcribe (callable): Function taking an audio file object and returning its text.
+            Defaults to transcribe_audio_with_whisper.
+        stop_event (threading.Event): Optional event that also stops the recording.
+        recording (RecordingBuffer): Optional buffer to record into, e.g. one the UI reads its timer from.
+    Returns:
+        list: One concurrent.futures.Future per segment, in recording order, each
+        resolving to the segment's transcription or raising its InstantGPTError.
+        Segments without speech are not uploaded and resolve to empty strings.
     """
+    transcribe = transcribe or transcribe_audio_with_whisper
+    frame_bytes = CHANNELS * SAMPLE_WIDTH
+    min_bytes = int(SEGMENT_SECONDS * RATE) * frame_bytes
+    max_bytes = int(MAX_SEGMENT_SECONDS * RATE) * frame_bytes
+    # Only the audio since the previous check, plus enough to hold a whole pause, is searched
+    pause_window = int((MIN_PAUSE_SECONDS + 2 * SEGMENT_POLL_SECONDS) * RATE) * frame_bytes
+
+    recording = recording or new_recording_buffer(stop_event)
+    listener, stop_recording = _start_space_listener(recording.stop_event)
+    executor = ThreadPoolExecutor(max_workers=TRANSCRIPTION_WORKERS)
+
+    segment_start = 0
+    futures = []
+
+    def encode_and_transcribe(frames, name):
+        upload = prepare_upload(frames, name=name)
+        return transcribe(upload) if upload else ""
+
+    def pause_in_tail(segment_end):
+        """
+        Byte offset of a pause at the end of the segment, or None.
+        """
+        tail_start = max(segment_start + min_bytes - pause_window, segment_end - pause_window)
+        samples = np.frombuffer(recording.read(tail_start, segment_end), dtype=np.int16).reshape(-1, CHANNELS)
+        pause = find_pause(samples, RATE, SILENCE_LEVEL)
+        return None if pause is None else tail_start + pause * frame_bytes
+
+    def quietest_point(segment_end):
+        """
+        Byte offset of the quietest moment of the segment's last part (find_split_points).
+        """
+        samples = np.frombuffer(recording.read(segment_start, segment_end), dtype=np.int16).reshape(-1, CHANNELS)
+        points = find_split_points(samples, RATE, len(samples) - 1)
+        return segment_start + points[0] * frame_bytes if points else segment_end
+
+    def submit_segment(segment_end):
+        # Copies only this segment; the recording buffer must stay resizable
+        segment = recording.read(segment_start, segment_end)
+        futures.append(executor.submit(propagate(encode_and_transcribe), segment, f"segment{len(futures)}"))
+
+    audio, stream = _open_input_stream(recording)
+    print("Recording... Press SPACE to stop.")
     try:
-        with open(filename, "rb") as audio_file:
-            response = client.audio.transcriptions.create(
-                file=audio_file,
-                model="whisper-1"
-            )
-        return response.text
-    except Exception as e:
-        return f"Error during transcription: {e}"
+        while not stop_recording.wait(SEGMENT_POLL_SECONDS):
+            segment_end = recording.size // frame_bytes * frame_bytes
+            segment_size = segment_end - segment_start
+            if segment_size >= max_bytes:
+                cut = quietest_point(segment_end)
+            elif segment_size >= min_bytes:
+                cut = pause_in_tail(segment_end)
+            else:
+                cut = None
+            if cut is not None:
+                submit_segment(cut)
+                segment_start = cut
+    finally:
+        listener.stop()
+        _close_input_stream(audio, stream)
+    print(f"Recording stats: {recording.stats()}")
+
+    if recording.size > segment_start:
+        submit_segment(recording.size)
+
+    if SAVE_RECORDING:
+        make_payload(recording.frames()).save(OUTPUT_FILENAME)
+        print(f"Recording saved to {OUTPUT_FILENAME}")
+
+    # Already submitted segments keep running; the pool just accepts no new work
+    executor.shutdown(wait=False)
+    return futures
+
+
+def _audio_digest(audio_source):
+    """
+    Hash the content of an audio file or in-memory upload, without copying payload frames.
+    """
+    digest = hashlib.sha256()
+    if isinstance(audio_source, WavPayload):
+        digest.update(audio_source.header)
+        digest.update(audio_source.frames)
+    elif hasattr(audio_source, "getbuffer"):
+        digest.update(audio_source.getbuffer())
+    else:
+        with open(audio_source, "rb") as audio_file:
+            for block in iter(lambda: audio_file.read(1024 * 1024), b""):
+                digest.update(block)
+    return digest.digest()
+
+
+def _audio_size(audio_source):
+    """
+    Size in bytes of an audio file or in-memory upload.
+    """
+    if isinstance(audio_source, WavPayload):
+        return audio_source.size
+    if hasattr(audio_source, "getbuffer"):
+        return audio_source.getbuffer().nbytes
+    return os.path.getsize(audio_source)
+
+
+def _open_upload(audio_source):
+    """
+    Open an independent reader over an audio file or in-memory upload, so that
+    a retried or hedged attempt never shares a file position with another one.
+    """
+    if isinstance(audio_source, WavPayload):
+        return WavPayload(audio_source.frames, audio_source.channels, audio_source.rate,
+                          audio_source.sample_width, audio_source.name)
+    if hasattr(audio_source, "getbuffer"):
+        reader = io.BytesIO(audio_source.getbuffer())
+        reader.name = audio_source.name
+        return reader
+    return open(audio_source, "rb")
+
+
+def _latency_kind(size):
+    # Upload time grows with the size, so hedging compares uploads within a factor of two
+    return f"transcription:{max(size >> 16, 1).bit_length()}"
+
+
+def transcribe_audio_with_whisper(audio_source=OUTPUT_FILENAME, retries=TRANSCRIPTION_RETRIES):
+    """
+    Use OpenAI's Whisper API to transcribe the audio.
+    Accepts either the path of an audio file or a named in-memory file object
+    such as a WavPayload or an encoded upload from prepare_upload.
+    Identical audio is answered from the response cache. Failed uploads are
+    retried up to `retries` times within TRANSCRIPTION_DEADLINE seconds, and
+    may be hedged (INSTANTGPT_HEDGE).
+
+    Returns:
+        str: The transcription.
+    Raises:
+        InstantGPTError: If every attempt failed or the deadline passed.
+    """
+    with span("upload", model=TRANSCRIPTION_MODEL) as upload:
+        cache_key = make_key("transcription", TRANSCRIPTION_MODEL, _audio_digest(audio_source))
+        cached = response_cache.get(cache_key)
+        upload.set(cached=cached is not None)
+        if cached is not None:
+            return cached
+
+        size = _audio_size(audio_source)
+        upload.set(bytes=size)
+
+        def attempt(timeout):
+            count("uploaded_bytes", size)
+            with _open_upload(audio_source) as audio_file:
+                return client.with_options(timeout=request_timeout(timeout)).audio.transcriptions.create(
+                    file=(os.path.basename(audio_file.name), audio_file),
+                    model=TRANSCRIPTION_MODEL
+                ).text
+
+        try:
+            transcription_text = call_with_retries(
+                attempt, _latency_kind(size), Deadline(TRANSCRIPTION_DEADLINE), retries, HEDGE_REQUESTS)
+        except InstantGPTError:
+            count("transcription_errors")
+            raise
+        response_cache.put(cache_key, transcription_text)
+        return transcription_text
+
+
+def transcribe_chunks(chunks, max_workers=TRANSCRIPTION_WORKERS, on_done=None):
+    """
+    Transcribe several audio chunks concurrently with a bounded worker pool.
+
+    Args:
+        chunks (list): Paths or WavPayloads of the chunks, in recording order.
+        max_workers (int): Maximum number of uploads running at the same time.
+        on_done (callable): Optional callback called with (index, text or error) as each chunk finishes.
+    Returns:
+        list: Transcription of each chunk in chunk order. Chunks that failed after
+        all retries hold their InstantGPTError, so the other chunks are kept.
+    """
+    if not chunks:
+        return []
+
+    def run(index, chunk):
+        try:
+            transcription_text = transcribe_audio_with_whisper(chunk)
+        except InstantGPTError as e:
+            transcription_text = e
+        if on_done:
+            on_done(index, transcription_text)
+        return transcription_text
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        futures = [executor.submit(propagate(run), index, chunk) for index, chunk in enumerate(chunks)]
+        return [future.result() for future in futures]
 
-def split_audio_with_wave(file_path, max_size_mb=24):
+
+def split_audio_buffer(recording, max_size_mb=MAX_UPLOAD_MB):
+    """
+    Convert an in-memory recording to the upload format, trim its silence and
+    split it into chunks under the max_size_mb size.
+
+    The split is sized on the converted PCM, which is an upper bound for the
+    compressed formats, so at 16 kHz mono a chunk holds about 13 minutes and
+    most recordings are uploaded in one piece. When a split is needed it is
+    moved back to the quietest point before the limit so words are not cut.
+
+    Args:
+        recording (bytes-like): Raw PCM frames returned by record_audio_until_space.
+        max_size_mb (int): Maximum size of each chunk in MB.
+    Returns:
+        list: Upload-ready file objects, in recording order (empty if there is no speech).
+    """
+    with span("split") as split:
+        samples = convert_pcm(recording, CHANNELS, RATE)
+        if TRIM_SILENCE:
+            samples = compact_speech(samples, UPLOAD_RATE)
+        if not len(samples):
+            return []
+
+        max_samples = (max_size_mb * 1024 * 1024 - WAV_HEADER_SIZE) // (UPLOAD_CHANNELS * 2)
+        bounds = [0] + find_split_points(samples, UPLOAD_RATE, max_samples) + [len(samples)]
+        split.set(chunks=len(bounds) - 1)
+        return [
+            encode_audio(samples[start:end], name=f"chunk{index}")
+            for index, (start, end) in enumerate(zip(bounds, bounds[1:]))
+        ]
+
+
+def split_audio_with_wave(file_path, max_size_mb=MAX_UPLOAD_MB, output_dir=None):
     """
     Split a WAV audio file into smaller chunks under the max_size_mb size using the wave module.
+    Only one chunk is read at a time. 16-bit chunks end at the quietest moment
+    before the limit (find_split_points), so words are not cut.
 
     Args:
         file_path (str): Path to the input WAV file.
         max_size_mb (int): Maximum size of each chunk in MB.
+        output_dir (str): Directory the chunks are written to; next to the input file by default.
     Returns:
         list: List of paths to the smaller audio chunks.
     """
-    max_size_bytes = max_size_mb * 1024 * 1024  # Convert max size to bytes
+    max_size_bytes = int(max_size_mb * 1024 * 1024)  # Convert max size to bytes
+    base = os.path.splitext(file_path)[0]
+    if output_dir:
+        base = os.path.join(output_dir, os.path.basename(base))
 
     with wave.open(file_path, 'rb') as wav_file:
         params = wav_file.getparams()
-        frame_rate = params.framerate
-        frame_width = params.sampwidth
-        n_channels = params.nchannels
+        frame_size = params.sampwidth * params.nchannels
 
-        # Calculate bytes per second
-        bytes_per_second = frame_rate * frame_width * n_channels
-
-        # Determine the max number of frames per chunk
-        max_frames = max_size_bytes // (frame_width * n_channels)
+        # Determine the max number of frames per chunk, header included
+        max_frames = (max_size_bytes - WAV_HEADER_SIZE) // frame_size
 
         chunk_paths = []
-        chunk_index = 0
+        position = 0
+
+        while position < params.nframes:
+            wav_file.setpos(position)
+            frames = wav_file.readframes(min(max_frames, params.nframes - position))
+            frame_count = len(frames) // frame_size
+            if not frame_count:
+                break
+            cut = frame_count
+            if position + frame_count < params.nframes and params.sampwidth == 2:
+                samples = np.frombuffer(frames, dtype=np.int16)[:frame_count * params.nchannels]
+                points = find_split_points(samples.reshape(-1, params.nchannels), params.framerate, frame_count - 1)
+                if points:
+                    cut = points[0]
 
-        while wav_file.tell() < wav_file.getnframes():
-            chunk_path = f"{os.path.splitext(file_path)[0]}_chunk{chunk_index}.wav"
+            chunk_path = f"{base}_chunk{len(chunk_paths)}.wav"
             with wave.open(chunk_path, 'wb') as chunk_file:
                 chunk_file.setparams(params)
-
-                # Write frames for the current chunk
-                frames_to_write = min(max_frames, wav_file.getnframes() - wav_file.tell())
-                frames = wav_file.readframes(frames_to_write)
-                chunk_file.writeframes(frames)
+                chunk_file.writeframes(frames[:cut * frame_size])
 
             chunk_paths.append(chunk_path)
-            chunk_index += 1
+            position += cut
 
     return chunk_paths
@@ -0,0 +1,297 @@
+"""
+Headless batch mode: run existing recordings through the transcribe-and-ask flow without the window.
+
+Each item is an audio file, optionally with an image or some text that plays
+the part of the clipboard. Items come from a directory (every audio file, with
+an image or .txt file of the same name next to it) or from a JSONL manifest:
+
+    {"id": "memo-1", "audio": "memos/memo-1.m4a", "image": "shots/screen.png"}
+    {"audio": "memos/memo-2.wav", "text_file": "notes/log.txt"}
+
+Results are appended to a JSONL file as each item finishes, one line per item.
+Items already answered in that file are skipped, so an interrupted run
+continues where it stopped when started again with the same output.
+
+    python -m utils.batch memos/ --output answers.jsonl --workers 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PIL import Image
+from utils.config import env_int, env_float
+from utils.audio import split_audio_with_wave, transcribe_audio_with_whisper, transcribe_chunks, MAX_UPLOAD_MB
+from utils.gpt_client import build_request, extract_relevant
+from utils.tokens import prepare_clipboard
+from utils.errors import InstantGPTError
+from utils.resilience import rate_limiter, REQUESTS_PER_MINUTE
+from utils.telemetry import start_trace, propagate
+
+BATCH_WORKERS = env_int("INSTANTGPT_BATCH_WORKERS", 4)  # Items processed at the same time
+BATCH_REQUESTS_PER_MINUTE = env_float("INSTANTGPT_BATCH_REQUESTS_PER_MINUTE", REQUESTS_PER_MINUTE)
+
+# Formats accepted by the transcription API; only WAV files over the upload limit can be split
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".mp4", ".mpeg", ".mpga", ".ogg", ".oga", ".webm", ".flac")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp")
+
+BatchItem = namedtuple("BatchItem", ["id", "audio", "image", "text_file", "text"])
+
+
+def _sidecar(base, extensions):
+    for extension in extensions:
+        for candidate in (base + extension, base + extension.upper()):
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+
+def items_from_directory(directory):
+    """
+    One item per audio file in directory (sorted by name), with the image or
+    .txt file of the same name, if there is one, as its context.
+    """
+    items = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        base, extension = os.path.splitext(path)
+        if not os.path.isfile(path) or extension.lower() not in AUDIO_EXTENSIONS:
+            continue
+        items.append(BatchItem(name, path, _sidecar(base, IMAGE_EXTENSIONS), _sidecar(base, (".txt",)), None))
+    return items
+
+
+def items_from_manifest(manifest_path):
+    """
+    Read items from a JSONL manifest with "audio" and optional "id", "image",
+    "text_file" and "text" fields. Relative paths are resolved against the manifest's directory.
+    """
+    root = os.path.dirname(os.path.abspath(manifest_path))
+
+    def resolve(path):
+        return os.path.join(root, path) if path else None
+
+    items = []
+    with open(manifest_path, encoding="utf-8") as manifest:
+        for line_number, line in enumerate(manifest, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                items.append(BatchItem(
+                    str(entry.get("id") or entry["audio"]),
+                    resolve(entry["audio"]),
+                    resolve(entry.get("image")),
+                    resolve(entry.get("text_file")),
+                    entry.get("text"),
+                ))
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{manifest_path}:{line_number}: invalid manifest entry ({e})")
+    return items
+
+
+def load_completed(output_path):
+    """
+    Return the ids of the items answered in an earlier run. Failed items are
+    tried again, and a line cut short by an interruption is ignored.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "rb") as output:
+        for line in output:
+            try:
+                result = json.loads(line.decode("utf-8"))
+                if result.get("status") == "ok":
+                    completed.add(result["id"])
+            except (ValueError, AttributeError, KeyError, TypeError):
+                continue  # Cut short, undecodable or not a result
+    return completed
+
+
+class ResultWriter:
+    """
+    Appends one JSON line per finished item and flushes it to disk right away,
+    so that nothing already answered is lost if the run is interrupted.
+    """
+
+    def __init__(self, output_path):
+        directory = os.path.dirname(os.path.abspath(output_path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Start on a new line if the last run stopped in the middle of one; checked
+        # on bytes, since the line may end in the middle of a UTF-8 character
+        needs_newline = False
+        if os.path.exists(output_path) and os.path.getsize(output_path):
+            with open(output_path, "rb") as existing:
+                existing.seek(-1, os.SEEK_END)
+                needs_newline = existing.read(1) != b"\n"
+        self._file = open(output_path, "a", encoding="utf-8")
+        if needs_newline:
+            self._file.write("\n")
+
+    def write(self, result):
+        line = json.dumps(result, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def transcribe_file(audio_path):
+    """
+    Transcribe one audio file. WAV files over the upload limit are split with
+    split_audio_with_wave into a temporary directory, removed afterwards.
+
+    Raises:
+        InstantGPTError: If a chunk could not be transcribed.
+    """
+    if os.path.getsize(audio_path) <= MAX_UPLOAD_MB * 1024 * 1024:
+        return transcribe_audio_with_whisper(audio_path)
+    if not audio_path.lower().endswith(".wav"):
+        raise ValueError(f"{os.path.basename(audio_path)} is over {MAX_UPLOAD_MB} MB; only WAV files can be split.")
+
+    with tempfile.TemporaryDirectory(prefix="instantgpt-") as chunk_dir:
+        transcriptions = transcribe_chunks(split_audio_with_wave(audio_path, output_dir=chunk_dir))
+    for transcription_text in transcriptions:
+        if isinstance(transcription_text, InstantGPTError):
+            raise transcription_text
+    return "\n".join(transcriptions)
+
+
+def process_item(item):
+    """
+    Transcribe an item's audio and ask about it, with its image or text as the
+    clipboard content. Returns the result line written to the output file.
+    """
+    start_trace()  # Groups the item's spans in the timing log
+    start = time.perf_counter()
+    result = {"id": item.id, "audio": item.audio}
+    try:
+        transcription_text = transcribe_file(item.audio)
+        result["transcription"] = transcription_text
+
+        image = None
+        clipboard_content = item.text
+        if item.image:
+            image = Image.open(item.image)
+            image.load()
+        elif item.text_file:
+            with open(item.text_file, encoding="utf-8", errors="replace") as text_file:
+                clipboard_content = text_file.read()
+        if clipboard_content and not image:
+            clipboard_content, clipboard_note = prepare_clipboard(clipboard_content, transcription_text, extract_relevant)
+            if clipboard_note:
+                result["clipboard_note"] = clipboard_note
+
+        include_clipboard = bool(image or clipboard_content)
+        send_request, request_args = build_request(include_clipboard, clipboard_content, transcription_text, image)
+        result["model"] = send_request.keywords["route"].model
+        result["response"] = send_request(*request_args)
+        result["status"] = "ok"
+    except Exception as e:
+        # One bad file must not stop an overnight run; the item is tried again on the next one
+        result["status"] = "error"
+        result["error"] = f"{e.__class__.__name__}: {e}"
+    result["seconds"] = round(time.perf_counter() - start, 2)
+    return result
+
+
+def run_batch(items, output_path, workers=BATCH_WORKERS):
+    """
+    Process items on a pool of workers, appending each result to output_path
+    as soon as it is ready. Items already answered in output_path are skipped.
+    API calls share the rate limiter of utils.resilience.
+
+    Returns:
+        dict: Counts of processed, failed and skipped items, elapsed seconds and items per minute.
+    """
+    completed = load_completed(output_path)
+    pending = [item for item in items if item.id not in completed]
+    skipped = len(items) - len(pending)
+    if skipped:
+        print(f"Skipping {skipped} items already answered in {output_path}.")
+
+    writer = ResultWriter(output_path)
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    start = time.perf_counter()
+    done = failed = 0
+
+    def record(result):
+        nonlocal done, failed
+        writer.write(result)
+        done += 1
+        failed += result["status"] != "ok"
+
+    futures = [executor.submit(propagate(process_item), item) for item in pending]
+    written = set()
+    try:
+        for future in as_completed(futures):
+            result = future.result()
+            record(result)
+            written.add(future)
+            elapsed = time.perf_counter() - start
+            rate = done / elapsed * 60
+            remaining = (len(pending) - done) / rate if rate else 0
+            print(f"[{done}/{len(pending)}] {result['id']}: {result['status']} in {result['seconds']:.1f}s"
+                  f" - {rate:.1f} items/min, about {remaining:.0f} min left")
+    except KeyboardInterrupt:
+        print("Interrupted; finishing the items in progress. Run again with the same output to resume.")
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in futures:
+            if future not in written and future.done() and not future.cancelled():
+                record(future.result())
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "processed": done,
+        "failed": failed,
+        "skipped": skipped,
+        "seconds": round(elapsed, 1),
+        "items_per_minute": round(done / elapsed * 60, 2) if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run recordings through InstantGPT without the window")
+    parser.add_argument("source", help="directory of audio files, or a JSONL manifest")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file the results are appended to")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="items processed at the same time")
+    parser.add_argument("--requests-per-minute", type=float, default=BATCH_REQUESTS_PER_MINUTE,
+                        help="limit on API calls across all workers")
+    args = parser.parse_args(argv)
+
+    try:
+        items = items_from_directory(args.source) if os.path.isdir(args.source) else items_from_manifest(args.source)
+    except (OSError, ValueError) as e:
+        print(f"Could not read {args.source}: {e}")
+        return 2
+    if not items:
+        print(f"No audio files found in {args.source}.")
+        return 1
+
+    rate_limiter.configure(args.requests_per_minute)
+    print(f"Processing {len(items)} items with {args.workers} workers, "
+          f"at most {args.requests_per_minute:g} requests per minute.")
+    try:
+        summary = run_batch(items, args.output, args.workers)
+    except KeyboardInterrupt:
+        return 130
+    print(f"Done: {summary['processed']} processed ({summary['failed']} failed), {summary['skipped']} skipped "
+          f"in {summary['seconds']:.0f}s - {summary['items_per_minute']:.1f} items/min. Results in {args.output}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from utils.config import env_flag, env_int, env_float, env_str
+from utils.telemetry import register_gauges
+
+# Cache settings for transcriptions and LLM responses
+CACHE_ENABLED = env_flag("INSTANTGPT_CACHE", True)
+CACHE_DIR = env_str("INSTANTGPT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".instantgpt", "cache"))
+CACHE_MAX_MB = env_float("INSTANTGPT_CACHE_MAX_MB", 50)  # Disk tier size before the oldest entries are evicted
+CACHE_TTL_HOURS = env_float("INSTANTGPT_CACHE_TTL_HOURS", 24 * 7)  # Entries older than this are ignored
+CACHE_MEMORY_ENTRIES = env_int("INSTANTGPT_CACHE_MEMORY_ENTRIES", 256)  # In-memory LRU tier size
+EVICT_INTERVAL_SECONDS = 3600  # Expired entries are swept at most this often, unless the size limit is hit
+
+
+def make_key(*parts):
+    """
+    Build a cache key from strings, bytes or buffers (hashed as they are, without copying).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        view = memoryview(part).cast("B")
+        digest.update(len(view).to_bytes(8, "little"))
+        digest.update(view)
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier, content-addressed cache of text results.
+
+    Lookups go to an in-memory LRU first, then to one JSON file per key on disk.
+    Entries expire ttl seconds after they were created, in both tiers. Each
+    file's modification time is its creation time and its access time the last
+    hit, so once the directory grows over max_bytes the least recently used
+    entries are removed. The size of the directory is tracked in memory between
+    scans, so a put only rescans it when the limit is reached or every
+    EVICT_INTERVAL_SECONDS to sweep expired entries.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=int(CACHE_MAX_MB * 1024 * 1024),
+                 ttl=CACHE_TTL_HOURS * 3600, memory_entries=CACHE_MEMORY_ENTRIES, enabled=CACHE_ENABLED):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.enabled = enabled
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self._disk_bytes = None  # Estimated size of the disk tier; None until scanned
+        self._last_scan = 0.0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _remember(self, key, value, created):
+        with self._lock:
+            self._memory[key] = (value, created)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss or when the cache is disabled.
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return entry[0]
+
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as cache_file:
+                entry = json.load(cache_file)
+            if now - entry["created"] < self.ttl:
+                # Access time for LRU eviction; the modification time stays the creation time
+                os.utime(self._path(key), (now, entry["created"]))
+                self._remember(key, entry["value"], entry["created"])
+                with self._lock:
+                    self.hits_disk += 1
+                return entry["value"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """
+        Store value under key in both tiers. Disk errors are ignored: the cache is best effort.
+        """
+        if not self.enabled:
+            return
+
+        created = time.time()
+        self._remember(key, value, created)
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            try:
+                previous_size = os.path.getsize(path)
+            except OSError:
+                previous_size = 0
+            temporary_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as cache_file:
+                json.dump({"created": created, "value": value}, cache_file)
+            os.utime(temporary_path, (created, created))
+            os.replace(temporary_path, path)
+            with self._lock:
+                if self._disk_bytes is not None:
+                    self._disk_bytes += os.path.getsize(path) - previous_size
+                scan = (self._disk_bytes is None or self._disk_bytes > self.max_bytes
+                        or created - self._last_scan > EVICT_INTERVAL_SECONDS)
+            if scan:
+                self._evict()
+        except OSError as e:
+            print(f"Could not write cache entry: {e}")
+
+    def _evict(self):
+        """
+        Delete expired entries, then the least recently used ones until the directory fits max_bytes.
+        """
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime >= self.ttl:
+                os.remove(entry.path)
+            else:
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+        with self._lock:
+            self._disk_bytes = total
+            self._last_scan = now
+
+    def stats(self):
+        """
+        Return hit and miss counters and the size of both tiers.
+        """
+        with self._lock:
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes or 0,
+            }
+
+
+# Shared cache used by the transcription and LLM calls
+response_cache = ResponseCache()
+register_gauges("cache", response_cache.stats)
@@ -0,0 +1,109 @@
+import threading
+import numpy as np
+from utils.config import env_float
+
+# Recording limits: capture stops when either one is reached
+MAX_RECORDING_SECONDS = env_float("INSTANTGPT_MAX_RECORDING_SECONDS", 900)
+MAX_RECORDING_MB = env_float("INSTANTGPT_MAX_RECORDING_MB", 256)  # Memory cap of the recording buffer
+INITIAL_BUFFER_SECONDS = 60  # Preallocated up front; the buffer doubles when this is used up
+
+
+class RecordingBuffer:
+    """
+    Bounded, growable buffer filled by the PortAudio callback.
+
+    Blocks are copied into a preallocated bytearray, which doubles in size when
+    full, so a long recording is a handful of allocations instead of one bytes
+    object per block. When MAX_RECORDING_SECONDS or MAX_RECORDING_MB is reached
+    the buffer stops accepting audio and sets stop_event, which ends the recording.
+
+    The level of the latest block and the captured duration can be read from any
+    thread while recording.
+    """
+
+    def __init__(self, channels, rate, sample_width, stop_event=None,
+                 max_seconds=MAX_RECORDING_SECONDS, max_mb=MAX_RECORDING_MB):
+        self.channels = channels
+        self.rate = rate
+        self.sample_width = sample_width
+        self.stop_event = stop_event or threading.Event()
+        self.bytes_per_second = channels * rate * sample_width
+
+        frame_size = channels * sample_width
+        limit = min(max_seconds * self.bytes_per_second, max_mb * 1024 * 1024)
+        self.capacity = int(limit) // frame_size * frame_size
+        initial = int(INITIAL_BUFFER_SECONDS * self.bytes_per_second) // frame_size * frame_size
+
+        self._data = bytearray(min(initial, self.capacity))
+        self._lock = threading.Lock()
+        self.size = 0
+        self.level = 0.0  # Mean absolute amplitude of the latest block
+        self.peak = 0  # Highest absolute amplitude so far
+        self.overflows = 0  # Blocks PortAudio reported as dropped
+        self.full = False
+
+    def write(self, data, overflowed=False):
+        """
+        Append a block of PCM frames. Called on the PortAudio callback thread, so it
+        only copies the block and updates the level.
+        """
+        if overflowed:
+            self.overflows += 1
+        if self.full:
+            return
+
+        samples = np.frombuffer(data, dtype=np.int16)
+        if len(samples):
+            magnitudes = np.abs(samples.astype(np.int32))
+            self.level = float(magnitudes.mean())
+            self.peak = max(self.peak, int(magnitudes.max()))
+
+        with self._lock:
+            data = data[:self.capacity - self.size]
+            end = self.size + len(data)
+            if end > len(self._data):
+                self._data.extend(bytes(min(max(2 * len(self._data), end), self.capacity) - len(self._data)))
+            self._data[self.size:end] = data
+            self.size = end
+            if self.size >= self.capacity:
+                self.full = True
+
+        if self.full:
+            print("Recording limit reached; stopping.")
+            self.stop_event.set()
+
+    def read(self, start=0, end=None):
+        """
+        Return a copy of the frames between two byte offsets; safe while recording.
+        """
+        with self._lock:
+            end = self.size if end is None else min(end, self.size)
+            return bytes(self._data[start:end])
+
+    def frames(self):
+        """
+        Return the recorded frames as a memoryview, without copying.
+        Only call this once recording has stopped: the buffer cannot grow while the view exists.
+        """
+        return memoryview(self._data)[:self.size]
+
+    @property
+    def duration(self):
+        """
+        Seconds of audio captured so far.
+        """
+        return self.size / self.bytes_per_second
+
+    def stats(self):
+        """
+        Return live recording statistics.
+        """
+        return {
+            "duration": self.duration,
+            "bytes": self.size,
+            "allocated": len(self._data),
+            "level": self.level,
+            "peak": self.peak,
+            "overflows": self.overflows,
+            "full": self.full,
+        }
@@ -1,19 +1,30 @@
 from PIL import ImageGrab, Image as PILImage
 import pyperclip
+from utils.config import env_flag
+from utils.telemetry import span
+
+# Clipboard images stay in memory; set this to also write them to disk for debugging
+SAVE_CLIPBOARD_IMAGE = env_flag("INSTANTGPT_SAVE_CLIPBOARD_IMAGE", False)
+CLIPBOARD_IMAGE_FILENAME = "clipboard_image.png"
 
 def process_clipboard_content():
     """
     Check if the clipboard contains an image or text,
     then process accordingly.
+    Returns (image, text): the decoded PIL image if there is one, otherwise the text.
     """
     try:
-        image = ImageGrab.grabclipboard()
-        if isinstance(image, PILImage.Image):
-            image_path = "clipboard_image.png"
-            image.save(image_path)
-            return image_path, None
-        else:
-            clipboard_content = pyperclip.paste()
-            return None, clipboard_content or "[No content]"
+        with span("clipboard_read") as read:
+            image = ImageGrab.grabclipboard()
+            if isinstance(image, PILImage.Image):
+                image.load()
+                read.set(kind="image", size=image.size)
+                if SAVE_CLIPBOARD_IMAGE:
+                    image.save(CLIPBOARD_IMAGE_FILENAME)
+                return image, None
+            else:
+                clipboard_content = pyperclip.paste()
+                read.set(kind="text", chars=len(clipboard_content or ""))
+                return None, clipboard_content or "[No content]"
     except Exception as e:
         return None, f"Error: {e}"
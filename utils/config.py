@@ -0,0 +1,43 @@
+from dotenv import load_dotenv
+import os
+
+# Load settings from the .env file once for every module that reads them
+load_dotenv()
+
+
+def env_str(name, default=None):
+    """
+    Read a string setting from the environment (or the .env file).
+    """
+    value = os.getenv(name)
+    return default if value is None or value == "" else value
+
+
+def env_flag(name, default=False):
+    """
+    Read a boolean setting. Accepts 1/0, true/false, yes/no and on/off.
+    """
+    value = env_str(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_int(name, default):
+    """
+    Read an integer setting, falling back to the default if it is missing or invalid.
+    """
+    try:
+        return int(env_str(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name, default):
+    """
+    Read a float setting, falling back to the default if it is missing or invalid.
+    """
+    try:
+        return float(env_str(name, default))
+    except (TypeError, ValueError):
+        return default
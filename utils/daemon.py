@@ -0,0 +1,80 @@
+import socket
+import threading
+from utils.config import env_flag, env_int, env_str
+
+# Resident mode: one background instance listens on this local port and for the hotkey
+DAEMON_MODE = env_flag("INSTANTGPT_DAEMON", False)
+DAEMON_PORT = env_int("INSTANTGPT_DAEMON_PORT", 47321)
+HOTKEY = env_str("INSTANTGPT_HOTKEY", "<ctrl>+<alt>+i")  # pynput GlobalHotKeys syntax
+ACK = b"instantgpt-ok\n"  # Reply proving the listener on the port is an InstantGPT daemon
+ACK_TIMEOUT_SECONDS = 1.0
+
+
+def forward_to_daemon(command="record", port=DAEMON_PORT):
+    """
+    Send a command to the running daemon, if any.
+    Returns True only if the daemon acknowledged it, so this launch can exit
+    right away; any other program listening on the port gets a normal start.
+    """
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=ACK_TIMEOUT_SECONDS) as connection:
+            connection.sendall(f"{command}\n".encode("utf-8"))
+            reply = b""
+            while len(reply) < len(ACK):
+                received = connection.recv(len(ACK) - len(reply))
+                if not received:
+                    break
+                reply += received
+        return reply == ACK
+    except OSError:
+        return False
+
+
+def start_instance_server(on_command, port=DAEMON_PORT):
+    """
+    Claim the single-instance lock by listening on the local port, and call
+    on_command with each command sent by forward_to_daemon.
+    Returns the listening socket, or None if another instance already holds the port.
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if hasattr(socket, "SO_EXCLUSIVEADDRUSE"):
+        # Windows would otherwise let a second process bind the same port
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+    try:
+        server.bind(("127.0.0.1", port))
+    except OSError:
+        server.close()
+        return None
+    server.listen()
+
+    def serve():
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return  # Socket closed on shutdown
+            with connection:
+                connection.settimeout(1)
+                try:
+                    command = connection.recv(64).decode("utf-8", "ignore").strip()
+                    if command:
+                        connection.sendall(ACK)
+                except OSError:
+                    continue
+            if command:
+                on_command(command)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server
+
+
+def start_hotkey_listener(on_trigger, hotkey=HOTKEY):
+    """
+    Call on_trigger (on the listener thread) whenever the global hotkey is pressed.
+    """
+    # Imported here so that forwarding a launch to the daemon stays cheap
+    from pynput import keyboard
+
+    listener = keyboard.GlobalHotKeys({hotkey: on_trigger})
+    listener.start()
+    return listener
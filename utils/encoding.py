@@ -0,0 +1,111 @@
+import io
+import numpy as np
+from utils.config import env_int, env_str
+from utils.wav import WavPayload
+
+# Upload format. The transcription model works on 16 kHz mono audio, so anything
+# above that is downsampled on the server anyway and only costs upload time.
+UPLOAD_CHANNELS = env_int("INSTANTGPT_UPLOAD_CHANNELS", 1)
+UPLOAD_RATE = env_int("INSTANTGPT_UPLOAD_RATE", 16000)
+UPLOAD_FORMAT = env_str("INSTANTGPT_UPLOAD_FORMAT", "flac").lower()  # wav, flac, mp3 or opus
+UPLOAD_BITRATE = env_str("INSTANTGPT_UPLOAD_BITRATE", "32k")  # Used by mp3 and opus
+
+# pydub export arguments and file extension for each compressed format
+CODECS = {
+    "flac": {"format": "flac", "extension": "flac"},
+    "mp3": {"format": "mp3", "extension": "mp3", "bitrate": True},
+    "opus": {"format": "ogg", "extension": "ogg", "codec": "libopus", "bitrate": True},
+}
+
+CONVERT_BLOCK_FRAMES = 1 << 16  # Output frames converted at a time (about 4 s at 16 kHz)
+
+# Set to False after the first failed export (usually ffmpeg missing) to stop retrying
+_codec_available = True
+
+
+def convert_pcm(frames, channels, rate, target_channels=UPLOAD_CHANNELS, target_rate=UPLOAD_RATE):
+    """
+    Downmix and resample 16-bit PCM frames with NumPy.
+
+    Integer rate ratios (48 kHz -> 16 kHz) average each group of samples, which
+    doubles as a simple anti-aliasing filter; other ratios use linear interpolation.
+    The work is done CONVERT_BLOCK_FRAMES output frames at a time, so the only
+    large allocation is the (smaller) int16 result, never a float copy of the recording.
+
+    Returns:
+        numpy.ndarray: Contiguous int16 samples, usable as a buffer.
+    """
+    samples = np.frombuffer(frames, dtype=np.int16)
+    samples = samples[:len(samples) // channels * channels].reshape(-1, channels)
+
+    if target_rate == rate:
+        count = len(samples)
+    elif rate % target_rate == 0:
+        factor = rate // target_rate
+        count = len(samples) // factor
+    else:
+        count = int(len(samples) * target_rate / rate)
+    converted = np.empty((count, target_channels), dtype=np.int16)
+
+    for out_start in range(0, count, CONVERT_BLOCK_FRAMES):
+        out_end = min(count, out_start + CONVERT_BLOCK_FRAMES)
+        if target_rate == rate:
+            block = samples[out_start:out_end].astype(np.float32)
+        elif rate % target_rate == 0:
+            block = samples[out_start * factor:out_end * factor].astype(np.float32)
+        else:
+            positions = np.arange(out_start, out_end) * (rate / target_rate)
+            in_start, in_end = int(positions[0]), min(len(samples), int(positions[-1]) + 2)
+            block = samples[in_start:in_end].astype(np.float32)
+
+        if target_channels == 1 and channels > 1:
+            block = block.mean(axis=1, keepdims=True)
+        elif target_channels != channels:
+            block = np.repeat(block.mean(axis=1, keepdims=True), target_channels, axis=1)
+
+        if target_rate != rate:
+            if rate % target_rate == 0:
+                block = block.reshape(-1, factor, block.shape[1]).mean(axis=1)
+            else:
+                source = np.arange(in_start, in_end)
+                block = np.stack([np.interp(positions, source, block[:, c]) for c in range(block.shape[1])], axis=1)
+
+        converted[out_start:out_end] = np.clip(np.rint(block), -32768, 32767)
+
+    return converted
+
+
+def encode_audio(samples, channels=UPLOAD_CHANNELS, rate=UPLOAD_RATE, name="audio", upload_format=UPLOAD_FORMAT):
+    """
+    Encode 16-bit PCM samples into an upload-ready file object.
+
+    WAV is served as a WavPayload over the samples. Compressed formats are
+    encoded in memory with pydub (which needs ffmpeg); if encoding fails the
+    payload falls back to WAV so a missing codec never blocks a transcription.
+
+    Returns:
+        file object: Readable, seekable object with a name carrying the right extension.
+    """
+    global _codec_available
+
+    codec = CODECS.get(upload_format)
+    if codec and _codec_available:
+        try:
+            from pydub import AudioSegment
+
+            segment = AudioSegment(data=bytes(samples), sample_width=2, frame_rate=rate, channels=channels)
+            encoded = io.BytesIO()
+            segment.export(
+                encoded,
+                format=codec["format"],
+                codec=codec.get("codec"),
+                bitrate=UPLOAD_BITRATE if codec.get("bitrate") else None,
+            )
+            encoded.name = f"{name}.{codec['extension']}"
+            encoded.seek(0)
+            return encoded
+        except Exception as e:
+            _codec_available = False
+            print(f"Could not encode audio as {upload_format}, uploading WAV instead: {e}")
+
+    return WavPayload(samples, channels, rate, 2, name=f"{name}.wav")
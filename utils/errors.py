@@ -0,0 +1,44 @@
+class InstantGPTError(Exception):
+    """
+    Base class of the errors raised by the transcription and LLM requests.
+    """
+
+    retryable = False
+
+
+class RequestCancelled(InstantGPTError):
+    """
+    Raised inside a request when its cancel_event is set.
+    """
+
+
+class DeadlineExceeded(InstantGPTError):
+    """
+    Raised when a request, including its retries, runs past its deadline.
+    """
+
+
+class StageTimeout(InstantGPTError):
+    """
+    Raised when a pipeline stage runs past its timeout.
+    """
+
+
+class APIRequestError(InstantGPTError):
+    """
+    A failed API call. retryable tells whether the same call may succeed later
+    (timeouts, connection errors, 5xx, 429); retry_after is the delay asked for
+    by the server, in seconds, if any.
+    """
+
+    def __init__(self, message, status=None, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class RateLimited(APIRequestError):
+    """
+    The API answered 429 Too Many Requests.
+    """
@@ -1,68 +1,330 @@
-from openai import OpenAI
-from dotenv import load_dotenv
+import time
+import json
 import base64
-import os
+import functools
+import threading
+from PIL import Image
+from utils.config import env_flag
+from utils.cache import response_cache, make_key
+from utils.image import prepare_image
+from utils.openai_client import client, request_timeout
+from utils.telemetry import span, record_duration, count, propagate
+from utils.routing import choose_route, latency_tracker, Route, FALLBACK_SECONDS, FAST_MODEL
+from utils.errors import InstantGPTError, RequestCancelled, APIRequestError
+from utils.resilience import Deadline, call_with_retries, COMPLETION_DEADLINE, HEDGE_REQUESTS
 
-# Charger la clé API OpenAI depuis le fichier .env
-load_dotenv()
+# Stream responses token by token to the result screen instead of waiting for the full completion
+STREAM_RESPONSES = env_flag("INSTANTGPT_STREAM_RESPONSES", True)
 
-# Initialiser l'objet client avec la clé API
-api_key = os.getenv("OPENAI_API_KEY")
-if api_key is None:
-    raise ValueError("API key not found. Make sure OPENAI_API_KEY is set in your .env file.")
-client = OpenAI(api_key=api_key)
+# Models that reject system messages; instructions are sent as user messages instead
+SYSTEMLESS_MODELS = ("o1-preview", "o1-mini")
 
 
-def send_image_to_gpt4o_with_transcript(image_path, transcript):
+class _EitherEvent:
     """
-    Send a base64-encoded image along with the transcribed text to GPT-4o.
-    Returns the generated response.
+    Read-only view that is set when any of the given events is set.
     """
-    try:
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": transcript,
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{base64_image}"},
-                        },
-                    ],
-                }
-            ],
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error sending image: {e}"
+
+    def __init__(self, *events):
+        self.events = [event for event in events if event is not None]
+
+    def is_set(self):
+        return any(event.is_set() for event in self.events)
+
+
+def _complete(cache_key, route, on_delta=None, cancel_event=None, **request_args):
+    """
+    Run a chat completion on the routed model and return its text.
+    If on_delta is given, the response is streamed and each text delta is passed
+    to on_delta as soon as it arrives; setting cancel_event then stops the stream.
+    Results are stored under cache_key, and a cached result is returned (and
+    passed to on_delta in one piece) without a request.
+    The request and any fallback share one deadline of COMPLETION_DEADLINE seconds.
+
+    Raises:
+        InstantGPTError: If the request failed, was cancelled or ran past its deadline.
+    """
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        count("llm_cache_hits")
+        if on_delta:
+            on_delta(cached)
+        return cached
+
+    print(f"Model: {route.model} ({route.reason})")
+    deadline = Deadline(COMPLETION_DEADLINE)
+    with span("llm", model=route.model, reason=route.reason, stream=on_delta is not None) as llm:
+        if route.fallback and FALLBACK_SECONDS > 0:
+            text, model = _complete_with_fallback(route, deadline, on_delta, cancel_event, **request_args)
+        else:
+            text, model = _request_completion(route.model, deadline, on_delta, cancel_event, **request_args), route.model
+        llm.set(answered_by=model, chars=len(text))
+    response_cache.put(cache_key, text)
+    return text
+
+
+def _complete_with_fallback(route, deadline, on_delta=None, cancel_event=None, **request_args):
+    """
+    Run the request on route.model, switching to route.fallback if nothing has
+    come back after FALLBACK_SECONDS. The abandoned request is cancelled and its
+    output discarded; its latency still counts against the model.
+    Returns (text, model that answered).
+    """
+    lock = threading.Lock()
+    first_output = threading.Event()
+    abandoned = threading.Event()
+    outcome = {}
+
+    def forward(delta):
+        # Under the lock so that no delta slips through once the request is abandoned
+        with lock:
+            if abandoned.is_set():
+                return
+            first_output.set()
+            on_delta(delta)
+
+    def run():
+        try:
+            outcome["text"] = _request_completion(
+                route.model, deadline, forward if on_delta else None, _EitherEvent(cancel_event, abandoned), **request_args)
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            first_output.set()
+
+    primary = threading.Thread(target=propagate(run), daemon=True)
+    primary.start()
+    if not first_output.wait(FALLBACK_SECONDS):
+        with lock:
+            if not first_output.is_set():
+                abandoned.set()
+    if abandoned.is_set():
+        print(f"{route.model} gave no answer within {FALLBACK_SECONDS:g} seconds; falling back to {route.fallback}.")
+        count("llm_fallbacks")
+        latency_tracker.record(route.model, FALLBACK_SECONDS)
+        return _request_completion(route.fallback, deadline, on_delta, cancel_event, **request_args), route.fallback
+
+    primary.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["text"], route.model
+
+
+def _request_completion(model, deadline, on_delta=None, cancel_event=None, **request_args):
+    """
+    Send a chat completion request, streaming it if on_delta is given, and
+    record the model's time to first output for routing.
+
+    Failed attempts are retried by call_with_retries within deadline, but a
+    stream that breaks after text was passed to on_delta is not: the text is
+    already on screen. Non-streamed requests may be hedged (INSTANTGPT_HEDGE).
+    """
+    def attempt(timeout):
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelled("Request cancelled")
+        api = client.with_options(timeout=request_timeout(timeout))
+        start = time.perf_counter()
+        if on_delta is None:
+            response = api.chat.completions.create(model=model, **request_args)
+            latency_tracker.record(model, time.perf_counter() - start)
+            return response.choices[0].message.content
+
+        parts = []
+        stream = api.chat.completions.create(model=model, stream=True, **request_args)
+        try:
+            for chunk in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RequestCancelled("Request cancelled")
+                deadline.check("The response")
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not parts:
+                        first_token = time.perf_counter() - start
+                        latency_tracker.record(model, first_token)
+                        record_duration("llm_first_token", first_token, model=model)
+                    parts.append(chunk.choices[0].delta.content)
+                    on_delta(chunk.choices[0].delta.content)
+        except Exception as e:
+            stream.close()
+            if parts and not isinstance(e, InstantGPTError):
+                raise APIRequestError(f"The response was interrupted: {e}") from e
+            raise
+        return "".join(parts)
+
+    return call_with_retries(attempt, f"chat:{model}", deadline, hedge=HEDGE_REQUESTS and on_delta is None)
+
+
+def system_role(model):
+    return "user" if model.startswith(SYSTEMLESS_MODELS) else "system"
+
+
+def _cache_key(kind, model, history, *parts):
+    # One-shot requests keep the keys they had before sessions existed
+    if history:
+        return make_key(kind, model, json.dumps(history, ensure_ascii=False), *parts)
+    return make_key(kind, model, *parts)
 
 
-def send_to_llm(prompt_text):
+def send_image_to_gpt4o_with_transcript(image, transcript, on_delta=None, cancel_event=None, route=None, history=None):
+    """
+    Send an image along with the transcribed text to the vision model (GPT-4o by default).
+    image is a PIL image or the path of an image file; it is resized and
+    encoded in memory by prepare_image before being base64-encoded.
+    Returns the generated response; if on_delta is given, it also receives
+    the response as it is generated, and setting cancel_event stops it.
+    route overrides the model chosen by utils.routing, and history (earlier
+    messages of a session) is sent before the new message.
+    Raises InstantGPTError if the request fails (see _complete).
+    """
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    route = route or choose_route(transcript, image=image)
+    image_bytes, mime_type, image_hash = prepare_image(image)
+    cache_key = _cache_key("vision", route.model, history, transcript, image_hash)
+    base64_image = base64.b64encode(image_bytes).decode("utf-8")
+
+    return _complete(
+        cache_key,
+        route,
+        on_delta,
+        cancel_event,
+        messages=(history or []) + [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": transcript,
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:{mime_type};base64,{base64_image}"},
+                    },
+                ],
+            }
+        ],
+    )
+
+
+def send_to_llm(prompt_text, on_delta=None, cancel_event=None, route=None, history=None):
     """
     Send the given text to OpenAI and return the response.
+    If on_delta is given, it also receives the response as it is generated,
+    and setting cancel_event stops it. The model is chosen by utils.routing
+    from the prompt, unless route is given. history holds the earlier messages
+    of a session, sent before the new one.
+    Raises InstantGPTError if the request fails (see _complete).
+    """
+    route = route or choose_route(prompt_text)
+    return _complete(
+        _cache_key("chat", route.model, history, prompt_text),
+        route,
+        on_delta,
+        cancel_event,
+        messages=(history or []) + [
+            #{"role": "system", "content": "You are an assistant helping a user with their tasks. Always respond in the language of the user unless otherwise specified."},
+            {"role": "user", "content": prompt_text}
+        ],
+        #temperature=0.7,  # Adjust creativity
+        #max_tokens=16384,   # Limit the response length
+        top_p=1.0,        # Typical value for full probability
+        frequency_penalty=0.0,
+        presence_penalty=0.0,
+        #reasoning_effort="high"
+    )
+
+
+def extract_relevant(chunk, question, index, total):
     """
+    Map step of the clipboard map-reduce: ask the fast model for the parts of
+    one chunk that matter for the user's request. Falls back to the start of
+    the chunk if the call fails.
+    """
+    prompt_text = (
+        f"This is part {index + 1} of {total} of a large text the user copied.\n"
+        f"The user's request: {question}\n\n"
+        "Copy out, verbatim, the lines that are relevant to the request, with a short note of context if needed. "
+        "If nothing is relevant, answer only NOTHING.\n\n"
+        f"Text:\n{chunk}"
+    )
     try:
-        response = client.chat.completions.create(
-            model="o1-preview",
-            messages=[
-                #{"role": "system", "content": "You are an assistant helping a user with their tasks. Always respond in the language of the user unless otherwise specified."},
-                {"role": "user", "content": prompt_text}
-            ],
-            #temperature=0.7,  # Adjust creativity
-            #max_tokens=16384,   # Limit the response length
-            top_p=1.0,        # Typical value for full probability
-            frequency_penalty=0.0,
-            presence_penalty=0.0,
-            #reasoning_effort="high"
+        return send_to_llm(prompt_text, route=Route(FAST_MODEL, None, f"clipboard part {index + 1}/{total}"))
+    except InstantGPTError as e:
+        print(f"Could not reduce clipboard part {index + 1}: {e}")
+        return chunk[:2000]
+
+
+def summarize_conversation(previous_summary, transcript):
+    """
+    Fold older turns of a session into its summary with the fast model.
+    If the call fails, the turns are dropped and the summary says so.
+    """
+    prompt_text = (
+        "Update the summary of a conversation between a user and an assistant with the exchanges below. "
+        "Keep the facts, decisions, names, numbers and code the user may refer to later; drop pleasantries. "
+        "Answer with the updated summary only, in the language of the conversation.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"Exchanges to add:\n{transcript}"
+    )
+    try:
+        return send_to_llm(prompt_text, route=Route(FAST_MODEL, None, "session summary"))
+    except InstantGPTError as e:
+        print(f"Could not summarize the conversation: {e}")
+        return f"{previous_summary}\n[Some earlier exchanges were dropped.]".strip()
+
+
+def _with_context(transcription_text):
+    return f"The audio transcription contains the user's request: {transcription_text}"
+
+
+def _session_request_text(transcription_text):
+    return f"Audio transcription:\n{_with_context(transcription_text)}\n"
+
+
+def build_request(include_clipboard, clipboard_content, transcription_text, image, session=None):
+    """
+    Build the request for the user's choice, routed on what the user said and the clipboard.
+    With a session (utils.session), the conversation so far is sent first and
+    clipboard text already shared in it is not repeated.
+    Returns the function to call (send_to_llm or send_image_to_gpt4o_with_transcript)
+    and its positional arguments.
+    """
+    transcription_text_with_context = _with_context(transcription_text)
+    if include_clipboard and image:
+        route = choose_route(transcription_text, image=image)
+    elif include_clipboard:
+        route = choose_route(transcription_text, clipboard_content)
+    else:
+        route = choose_route(transcription_text)
+
+    if session is not None:
+        history = session.prefix(system_role(route.model))
+        request_text = _session_request_text(transcription_text)
+        if include_clipboard and image:
+            return (functools.partial(send_image_to_gpt4o_with_transcript, route=route, history=history),
+                    (image, session.user_message(request_text, image=image)))
+        user_message = session.user_message(request_text, clipboard_content if include_clipboard else None)
+        return functools.partial(send_to_llm, route=route, history=history), (user_message,)
+
+    if include_clipboard:
+        if image:
+            return functools.partial(send_image_to_gpt4o_with_transcript, route=route), (image, transcription_text_with_context)
+        combined_prompt = (
+            f"Clipboard content:\n{clipboard_content}\n\n"
+            f"Audio transcription:\n{transcription_text_with_context}\n"
         )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error calling LLM: {e}"
\ No newline at end of file
+    else:
+        combined_prompt = (
+            f"Audio transcription:\n{transcription_text_with_context}\n"
+        )
+    return functools.partial(send_to_llm, route=route), (combined_prompt,)
+
+
+def record_turn(session, include_clipboard, clipboard_content, transcription_text, image, response):
+    """
+    Add a completed request built by build_request to its session.
+    Returns True if the session should now be compacted with summarize_conversation.
+    """
+    return session.add_turn(_session_request_text(transcription_text),
+                            clipboard_content if include_clipboard else None,
+                            image if include_clipboard else None,
+                            response)
@@ -0,0 +1,93 @@
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+from utils.config import env_int, env_str
+from utils.telemetry import span
+
+# Vision models tile images at high detail after fitting them in 2048x2048 and
+# scaling the short side down to 768 px; anything larger is wasted upload.
+IMAGE_MAX_SIDE = env_int("INSTANTGPT_IMAGE_MAX_SIDE", 2048)
+IMAGE_SHORT_SIDE = env_int("INSTANTGPT_IMAGE_SHORT_SIDE", 768)
+IMAGE_FORMAT = env_str("INSTANTGPT_IMAGE_FORMAT", "auto").lower()  # auto, png, jpeg or webp
+IMAGE_QUALITY = env_int("INSTANTGPT_IMAGE_QUALITY", 85)  # Used by jpeg and webp
+GRAPHIC_MAX_COLORS = 2048  # Fewer colors than this in a thumbnail means text or UI, not a photo
+PREPARED_CACHE_ENTRIES = 16
+
+_prepared_cache = OrderedDict()
+_prepared_lock = threading.Lock()
+
+
+def image_digest(image):
+    """
+    Hash the pixels of a PIL image.
+    """
+    digest = hashlib.sha256(f"{image.mode}{image.size}".encode("utf-8"))
+    digest.update(image.tobytes())
+    return digest.digest()
+
+
+def target_size(width, height, max_side=IMAGE_MAX_SIDE, short_side=IMAGE_SHORT_SIDE):
+    """
+    Return the size the vision model would scale the image to, never upscaling.
+    """
+    scale = min(1.0, max_side / max(width, height))
+    if min(width, height) * scale > short_side:
+        scale = short_side / min(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def is_graphic(image):
+    """
+    Guess whether an image is text, a UI screenshot or a diagram rather than a photo,
+    from the number of distinct colors in a thumbnail. The thumbnail is sampled
+    with NEAREST: smoothing would blend anti-aliased glyphs into thousands of colors.
+    """
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((256, 256), resample=Image.NEAREST, reducing_gap=None)
+    return thumbnail.getcolors(maxcolors=GRAPHIC_MAX_COLORS) is not None
+
+
+def prepare_image(image, image_format=IMAGE_FORMAT):
+    """
+    Resize and encode a PIL image for a vision request, in memory.
+
+    Text-heavy images stay lossless (PNG) so small glyphs survive, photographic
+    ones are sent as JPEG, unless image_format forces a format. Results are
+    cached by pixel hash, so asking again about the same screenshot skips the work.
+
+    Returns:
+        tuple: (encoded bytes, MIME type, SHA-256 digest of the encoded bytes).
+    """
+    key = (image_digest(image), image_format)
+    with _prepared_lock:
+        if key in _prepared_cache:
+            _prepared_cache.move_to_end(key)
+            return _prepared_cache[key]
+
+    with span("image_encode") as encode:
+        if image_format == "auto":
+            # Classified before resizing, which blends text into many colors too
+            image_format = "png" if is_graphic(image) else "jpeg"
+
+        size = target_size(*image.size)
+        resized = image.resize(size, Image.LANCZOS) if size != image.size else image
+
+        encoded = io.BytesIO()
+        if image_format == "png":
+            resized.save(encoded, format="PNG", optimize=True)
+        elif image_format == "webp":
+            resized.save(encoded, format="WEBP", quality=IMAGE_QUALITY)
+        else:
+            image_format = "jpeg"
+            resized.convert("RGB").save(encoded, format="JPEG", quality=IMAGE_QUALITY, optimize=True)
+
+        data = encoded.getvalue()
+        encode.set(format=image_format, size=size, bytes=len(data))
+    prepared = (data, f"image/{image_format}", hashlib.sha256(data).digest())
+    with _prepared_lock:
+        _prepared_cache[key] = prepared
+        while len(_prepared_cache) > PREPARED_CACHE_ENTRIES:
+            _prepared_cache.popitem(last=False)
+    return prepared
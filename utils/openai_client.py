@@ -0,0 +1,106 @@
+import time
+import threading
+import httpx
+from openai import OpenAI, DefaultHttpxClient
+from utils.config import env_str, env_int, env_float
+
+# Connection pool and timeouts shared by every API call
+MAX_CONNECTIONS = env_int("INSTANTGPT_MAX_CONNECTIONS", 20)
+MAX_KEEPALIVE_CONNECTIONS = env_int("INSTANTGPT_MAX_KEEPALIVE_CONNECTIONS", 10)
+KEEPALIVE_SECONDS = env_float("INSTANTGPT_KEEPALIVE_SECONDS", 120)  # Idle connections are kept this long
+CONNECT_TIMEOUT = env_float("INSTANTGPT_CONNECT_TIMEOUT", 5)
+READ_TIMEOUT = env_float("INSTANTGPT_READ_TIMEOUT", 120)  # Reasoning models can think for a while
+WRITE_TIMEOUT = env_float("INSTANTGPT_WRITE_TIMEOUT", 60)  # Audio uploads
+
+# Initialize the OpenAI client with the API key
+api_key = env_str("OPENAI_API_KEY")
+if api_key is None:
+    raise ValueError("API key not found. Make sure OPENAI_API_KEY is set in your .env file.")
+base_url = env_str("OPENAI_BASE_URL")  # Any OpenAI-compatible server, e.g. the benchmark stand-in
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "new_connections": 0, "tls_handshakes": 0, "prewarms": 0}
+_last_prewarm = 0.0
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _trace(event_name, info):
+    """
+    httpcore trace callback: counts the connections actually opened, so that
+    requests minus new connections is the number of reused connections.
+    """
+    if event_name == "connection.connect_tcp.complete":
+        _count("new_connections")
+    elif event_name == "connection.start_tls.complete":
+        _count("tls_handshakes")
+
+
+def _on_request(request):
+    _count("requests")
+    request.extensions["trace"] = _trace
+
+
+timeout = httpx.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT, write=WRITE_TIMEOUT, pool=CONNECT_TIMEOUT)
+
+http_client = DefaultHttpxClient(
+    limits=httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_SECONDS,
+    ),
+    timeout=timeout,
+    event_hooks={"request": [_on_request]},
+)
+
+# Single client shared by the transcription and chat calls; retries are done by utils.resilience
+client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, timeout=timeout, max_retries=0)
+
+
+def request_timeout(seconds):
+    """
+    The shared timeouts, each capped to the seconds left before a request's deadline.
+    """
+    seconds = max(seconds, 0.001)
+    return httpx.Timeout(
+        connect=min(CONNECT_TIMEOUT, seconds),
+        read=min(READ_TIMEOUT, seconds),
+        write=min(WRITE_TIMEOUT, seconds),
+        pool=min(CONNECT_TIMEOUT, seconds),
+    )
+
+
+def prewarm_connections():
+    """
+    Open a connection to the API in the background (DNS, TCP and TLS) so that the
+    first real request, made once the user stops talking, reuses it.
+    Does nothing if a connection was warmed within the keep-alive period.
+    """
+    global _last_prewarm
+    now = time.monotonic()
+    if now - _last_prewarm < KEEPALIVE_SECONDS / 2:
+        return
+    _last_prewarm = now
+
+    def warm():
+        try:
+            # Cheap authenticated request; the connection stays in the pool afterwards
+            client.models.list()
+            _count("prewarms")
+        except Exception as e:
+            print(f"Could not pre-connect to the API: {e}")
+
+    threading.Thread(target=warm, daemon=True).start()
+
+
+def connection_stats():
+    """
+    Return request and connection counters; reused = requests - new_connections.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["reused_connections"] = stats["requests"] - stats["new_connections"]
+    return stats
@@ -0,0 +1,335 @@
+import time
+import asyncio
+import threading
+from utils.config import env_float, env_int
+from utils.audio import record_audio_until_space, record_audio_streaming, new_recording_buffer, split_audio_buffer, transcribe_chunks, STREAMING_TRANSCRIPTION
+from utils.clipboard import process_clipboard_content
+from utils.gpt_client import build_request, extract_relevant, record_turn, summarize_conversation, STREAM_RESPONSES
+from utils.image import prepare_image
+from utils.openai_client import prewarm_connections, connection_stats
+from utils.cache import response_cache
+from utils.speculation import SpeculativeRequest, SPECULATE, SPECULATE_MAX_CHARS
+from utils.tokens import prepare_clipboard, fits, CLIPBOARD_TOKEN_BUDGET
+from utils.session import Session, SESSION_MODE
+from utils.telemetry import span, start_trace, propagate, register_gauges, TELEMETRY_ENABLED
+from utils.errors import InstantGPTError, StageTimeout
+
+# Per-stage limits
+CLIPBOARD_TIMEOUT = env_float("INSTANTGPT_CLIPBOARD_TIMEOUT", 5)
+TRANSCRIPTION_TIMEOUT = env_float("INSTANTGPT_TRANSCRIPTION_TIMEOUT", 180)
+RESPONSE_TIMEOUT = env_float("INSTANTGPT_RESPONSE_TIMEOUT", 600)
+CONTEXT_TIMEOUT = env_float("INSTANTGPT_CONTEXT_TIMEOUT", 180)  # Reducing oversized clipboard text
+MAX_PENDING_REQUESTS = env_int("INSTANTGPT_MAX_PENDING_REQUESTS", 2)  # Further hotkey presses are dropped
+
+
+class Request:
+    """
+    State of one request as it moves through the pipeline.
+    """
+
+    def __init__(self):
+        self.stage = "record"
+        self.stop_recording = threading.Event()
+        self.cancel_event = threading.Event()
+        self.speculations = {}
+        self.trace = None
+        self.session = None
+
+    def cancel(self):
+        """
+        Stop the microphone and every streamed response started for this request.
+        """
+        self.stop_recording.set()
+        self.cancel_event.set()
+        for speculation in self.speculations.values():
+            speculation.cancel()
+
+
+class Pipeline:
+    """
+    Runs each request through the record -> clipboard -> transcribe -> prompt ->
+    respond stages on an asyncio loop owned by a background thread.
+
+    Blocking work (microphone, uploads, LLM calls) runs in worker threads through
+    asyncio.to_thread, so every stage can be awaited with a timeout and cancelled;
+    cancelling also sets the events that stop the microphone and the response
+    streams. A new request supersedes the one on screen, unless that one is still
+    recording. Requests wait in a bounded queue, so a burst of hotkey presses is
+    dropped instead of piling up. The window is only updated through app.post,
+    which the Tk loop drains in batches. In session mode (INSTANTGPT_SESSION)
+    successive requests continue one conversation until it has been idle for
+    SESSION_IDLE_MINUTES.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+        self.current = None
+        self.current_request = None
+        self.session = None
+        self._requests = None
+        self._started = threading.Event()
+        threading.Thread(target=self._run_loop, daemon=True).start()
+        self._started.wait()
+        if SESSION_MODE:
+            register_gauges("session", self._session_stats)
+
+    def _session_stats(self):
+        # Read by the metrics server thread
+        session = self.session
+        if session is None:
+            return {}
+        return {"history_tokens": session.history_tokens(), "turns": len(session.turns),
+                "summarized_turns": session.summarized_turns}
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._serve())
+
+    async def _serve(self):
+        self._requests = asyncio.Queue(maxsize=MAX_PENDING_REQUESTS)
+        self._started.set()
+        while True:
+            await self._requests.get()
+            if self.current_request and self.current_request.stage == "record" and not self.current.done():
+                continue  # Already recording; the hotkey does not restart it
+            if self.current and not self.current.done():
+                self.current.cancel()
+                await asyncio.gather(self.current, return_exceptions=True)
+            self.current_request = Request()
+            self.current = self.loop.create_task(self.run_request(self.current_request))
+
+    def submit(self):
+        """
+        Queue a new request. Safe to call from any thread.
+        """
+        self.loop.call_soon_threadsafe(self._enqueue)
+
+    def _enqueue(self):
+        try:
+            self._requests.put_nowait(time.time())
+        except asyncio.QueueFull:
+            print("Too many pending requests; ignoring this one.")
+
+    def cancel(self):
+        """
+        Cancel the request in progress, e.g. when the window is closed. Safe to call from any thread.
+        """
+        self.loop.call_soon_threadsafe(lambda: self.current and self.current.cancel())
+
+    def log(self, message):
+        self.app.post(self.app.update_log, message)
+
+    async def stage(self, request, name, awaitable, timeout):
+        """
+        Await one stage, converting a timeout into StageTimeout with a readable message.
+        """
+        request.stage = name
+        try:
+            with span(name):
+                return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise StageTimeout(f"The {name} step took longer than {timeout:.0f} seconds and was stopped.")
+
+    async def run_request(self, request):
+        # Every span recorded while handling this request, in any thread, joins this trace
+        request.trace = start_trace()
+        if SESSION_MODE:
+            if self.session is None or self.session.expired:
+                self.session = Session()
+            request.session = self.session
+        try:
+            with span("record"):
+                recording, segment_futures = await self.record(request)
+
+            self.log("Checking clipboard content...")
+            image, clipboard_content = await self.stage(
+                request, "clipboard", asyncio.to_thread(process_clipboard_content), CLIPBOARD_TIMEOUT)
+            if image:
+                self.log("Clipboard contains an image.")
+                # Resize and encode the image while the audio is transcribed; the result is cached
+                threading.Thread(target=propagate(prepare_image), args=(image,), daemon=True).start()
+            elif clipboard_content:
+                self.log("Clipboard contains text.")
+            else:
+                self.log("Clipboard is empty or invalid.")
+
+            transcription_text = await self.stage(
+                request, "transcription", self.transcribe(recording, segment_futures), TRANSCRIPTION_TIMEOUT)
+
+            with span("prompt"):
+                include_clipboard = await self.ask_user(request, clipboard_content, transcription_text, image)
+
+            clipboard_note = None
+            if include_clipboard and not image and clipboard_content:
+                # Oversized clipboard text is deduplicated, truncated or map-reduced to the token budget
+                clipboard_content, clipboard_note = await self.stage(
+                    request, "context",
+                    asyncio.to_thread(prepare_clipboard, clipboard_content, transcription_text, extract_relevant),
+                    CONTEXT_TIMEOUT)
+                if clipboard_note:
+                    self.log(f"Clipboard: {clipboard_note}")
+
+            gpt_response = await self.stage(
+                request, "response",
+                self.respond(request, include_clipboard, clipboard_content, transcription_text, image, clipboard_note),
+                RESPONSE_TIMEOUT)
+            if request.session is not None and isinstance(gpt_response, str):
+                if record_turn(request.session, include_clipboard, clipboard_content, transcription_text, image, gpt_response):
+                    # Summarize older turns now, so the next follow-up does not wait for it
+                    threading.Thread(target=propagate(request.session.compact), args=(summarize_conversation,),
+                                     daemon=True).start()
+            if TELEMETRY_ENABLED:
+                self.app.post(self.app.show_timings, request.trace.summary())
+        except asyncio.CancelledError:
+            request.cancel()
+            raise
+        except StageTimeout as e:
+            request.cancel()
+            self.log(str(e))
+        except Exception as e:
+            request.cancel()
+            self.log(f"Error during the {request.stage} step: {e}")
+
+    async def record(self, request):
+        """
+        Record until SPACE, cancellation or the recording buffer's limit.
+        Returns (recording, None) or, in streaming mode, (None, segment futures).
+        """
+        if self.app.daemon:
+            self.app.post(self.app.show_recording_screen)
+
+        # Connect to the API while the user is still talking
+        prewarm_connections()
+        # The timer shows the duration actually captured, read from the buffer
+        recording = new_recording_buffer(request.stop_recording)
+        self.app.post(self.app.start_timer, recording)
+        self.log("Recording started...")
+
+        if STREAMING_TRANSCRIPTION:
+            # Segments are transcribed in the background while recording
+            recorder = asyncio.ensure_future(asyncio.to_thread(record_audio_streaming, recording=recording))
+        else:
+            recorder = asyncio.ensure_future(asyncio.to_thread(record_audio_until_space, recording=recording))
+        try:
+            # Shielded so that on cancellation the microphone is released before moving on
+            result = await asyncio.shield(recorder)
+        except asyncio.CancelledError:
+            request.stop_recording.set()
+            await asyncio.gather(recorder, return_exceptions=True)
+            raise
+
+        self.log("Recording stopped.")
+        self.log(f"Total recording duration: {int(recording.duration)} seconds")
+        return (None, result) if STREAMING_TRANSCRIPTION else (result, None)
+
+    async def transcribe(self, recording, segment_futures):
+        """
+        Wait for the streamed segments, or split and transcribe the recording,
+        and return the combined transcription.
+        """
+        full_transcription = []
+        if segment_futures is not None:
+            segment_transcriptions = await asyncio.gather(
+                *map(asyncio.wrap_future, segment_futures), return_exceptions=True)
+            self.log(f"Audio transcribed in {len(segment_transcriptions)} segments.")
+            for index, transcription_text in enumerate(segment_transcriptions):
+                if isinstance(transcription_text, InstantGPTError):
+                    self.log(f"Error during transcription of segment {index}: {transcription_text}")
+                elif transcription_text:
+                    full_transcription.append(transcription_text)
+        else:
+            self.log("Splitting audio into chunks if necessary...")
+            chunks = await asyncio.to_thread(split_audio_buffer, recording)
+            self.log(f"Audio split into {len(chunks)} chunks.")
+
+            self.log("Transcribing...")
+            for chunk, transcription_text in zip(chunks, await asyncio.to_thread(transcribe_chunks, chunks)):
+                if isinstance(transcription_text, InstantGPTError):
+                    self.log(f"Error during transcription of {chunk.name}: {transcription_text}")
+                else:
+                    full_transcription.append(transcription_text)
+            self.log(f"{len(full_transcription)} of {len(chunks)} chunks transcribed.")
+
+        print(f"API connections: {connection_stats()}, cache: {response_cache.stats()}")
+        combined_transcription = "\n".join(full_transcription)
+        if combined_transcription:
+            self.log("Combined transcription ready for display.")
+        else:
+            self.log("No transcription available to display.")
+        return combined_transcription
+
+    async def ask_user(self, request, clipboard_content, transcription_text, image):
+        """
+        Show the clipboard prompt and wait for the user's answer, speculatively
+        starting both requests meanwhile if that mode is on.
+        """
+        request.stage = "prompt"
+        choice = self.loop.create_future()
+
+        def on_choice(include_clipboard):
+            # Called on the Tk loop
+            self.loop.call_soon_threadsafe(lambda: choice.done() or choice.set_result(include_clipboard))
+
+        self.log("Displaying transcription and clipboard content...")
+        self.app.post(self.app.show_clipboard_prompt, clipboard_content, transcription_text, image, on_choice)
+
+        # Images (two vision requests) and text that needs reducing first are not speculated on;
+        # tokenized only if the cheap checks pass
+        if (SPECULATE and not image and len(clipboard_content or "") <= SPECULATE_MAX_CHARS
+                and fits(clipboard_content or "", CLIPBOARD_TOKEN_BUDGET)):
+            request.speculations = {
+                include_clipboard: SpeculativeRequest(
+                    *build_request(include_clipboard, clipboard_content, transcription_text, image, request.session))
+                for include_clipboard in (True, False)
+            }
+        return await choice
+
+    async def respond(self, request, include_clipboard, clipboard_content, transcription_text, image, clipboard_note=None):
+        """
+        Send the chosen request (or adopt its speculative run), show the response
+        and return it (an exception if the request failed).
+        """
+        speculation = request.speculations.pop(include_clipboard, None)
+        for other in request.speculations.values():
+            other.cancel()
+        request.speculations = {include_clipboard: speculation} if speculation else {}
+
+        if not speculation and not STREAM_RESPONSES:
+            self.app.post(self.app.show_processing_screen)
+            send_request, request_args = build_request(include_clipboard, clipboard_content, transcription_text, image, request.session)
+            try:
+                gpt_response = await asyncio.to_thread(send_request, *request_args)
+            except InstantGPTError as e:
+                gpt_response = e
+            response_text = gpt_response if isinstance(gpt_response, str) else f"Error: {gpt_response}"
+            self.app.post(self.app.show_result_screen, include_clipboard, clipboard_content, transcription_text, response_text, image,
+                          False, clipboard_note)
+            return gpt_response
+
+        on_delta, on_done = self.app.start_response()
+        self.app.post(self.app.show_result_screen, include_clipboard, clipboard_content, transcription_text, "", image,
+                      True, clipboard_note)
+
+        if speculation:
+            # The chosen request is already running; replay what it has streamed so far
+            finished = self.loop.create_future()
+
+            def resolve(gpt_response):
+                if not finished.done():
+                    finished.set_result(gpt_response)
+
+            def on_speculation_done(gpt_response):
+                on_done(gpt_response)
+                self.loop.call_soon_threadsafe(resolve, gpt_response)
+
+            speculation.adopt(on_delta, on_speculation_done)
+            return await finished
+
+        send_request, request_args = build_request(include_clipboard, clipboard_content, transcription_text, image, request.session)
+        try:
+            gpt_response = await asyncio.to_thread(send_request, *request_args, on_delta=on_delta, cancel_event=request.cancel_event)
+        except InstantGPTError as e:
+            gpt_response = e
+        on_done(gpt_response)
+        return gpt_response
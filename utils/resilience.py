@@ -0,0 +1,270 @@
+import math
+import time
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+import openai
+from utils.config import env_flag, env_int, env_float
+from utils.errors import InstantGPTError, APIRequestError, RateLimited, DeadlineExceeded
+from utils.telemetry import count, propagate
+
+# Retries: full-jitter exponential backoff, or the server's Retry-After if it is longer
+MAX_RETRIES = env_int("INSTANTGPT_MAX_RETRIES", 3)
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20
+
+# Deadlines cover every attempt and the waits between them
+TRANSCRIPTION_DEADLINE = env_float("INSTANTGPT_TRANSCRIPTION_DEADLINE", 90)
+COMPLETION_DEADLINE = env_float("INSTANTGPT_COMPLETION_DEADLINE", 300)
+
+# Hedging: send a duplicate when the first attempt is slower than the recent p95
+HEDGE_REQUESTS = env_flag("INSTANTGPT_HEDGE", False)
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20  # Latencies needed before the p95 is trusted
+LATENCY_WINDOW = 200
+
+# Shared token bucket for every API call
+REQUESTS_PER_MINUTE = env_float("INSTANTGPT_REQUESTS_PER_MINUTE", 120)
+REQUEST_BURST = env_int("INSTANTGPT_REQUEST_BURST", 8)
+
+RETRYABLE_STATUS = (408, 409, 429)
+
+
+class Deadline:
+    """
+    Absolute point in time by which a request must be done.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires - time.monotonic()
+
+    def check(self, what="The request"):
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"{what} did not finish within {self.seconds:g} seconds.")
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter shared by all threads. acquire() waits for a token;
+    pause() holds every caller back, e.g. for the Retry-After of a 429.
+    """
+
+    def __init__(self, per_minute=REQUESTS_PER_MINUTE, burst=REQUEST_BURST):
+        self.rate = per_minute / 60
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def configure(self, per_minute, burst=None):
+        """
+        Change the rate (and burst) at runtime, e.g. from a command-line option.
+        """
+        with self._lock:
+            self.rate = per_minute / 60
+            if burst is not None:
+                self.capacity = max(1, burst)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def _take(self):
+        """
+        Take a token if one is available; return 0, or the seconds to wait for one. Call with the lock held.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now >= self.paused_until and self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return max(self.paused_until - now, (1 - self.tokens) / self.rate if self.rate > 0 else 1.0)
+
+    def try_acquire(self):
+        """
+        Take a token only if one is available right away; return whether it was taken.
+        """
+        with self._lock:
+            return self._take() == 0
+
+    def acquire(self, deadline=None):
+        while True:
+            with self._lock:
+                wait = self._take()
+            if not wait:
+                return
+            if deadline is not None and wait >= deadline.remaining():
+                raise DeadlineExceeded("Waited for the rate limit until the deadline.")
+            count("rate_limit_waits")
+            time.sleep(min(wait, 1.0))
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class LatencyWindow:
+    """
+    The latest successful latencies of each kind of request, for the hedging threshold.
+    """
+
+    def __init__(self, size=LATENCY_WINDOW):
+        self.size = size
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, kind, seconds):
+        with self._lock:
+            self._samples.setdefault(kind, deque(maxlen=self.size)).append(seconds)
+
+    def percentile(self, kind, q=HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES):
+        with self._lock:
+            samples = sorted(self._samples.get(kind, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(len(samples) * q / 100) - 1)]
+
+
+rate_limiter = TokenBucket()
+latencies = LatencyWindow()
+
+
+def _retry_after(response):
+    """
+    Read the delay asked for by the server, in seconds, from retry-after-ms or Retry-After.
+    """
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(error):
+    """
+    Turn an exception from the OpenAI SDK (or anything else) into an InstantGPTError.
+    """
+    if isinstance(error, InstantGPTError):
+        return error
+    if isinstance(error, openai.APITimeoutError):
+        return APIRequestError(f"The API did not answer in time: {error}", retryable=True)
+    if isinstance(error, openai.APIConnectionError):
+        return APIRequestError(f"Could not reach the API: {error}", retryable=True)
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+        retry_after = _retry_after(error.response)
+        if status == 429:
+            return RateLimited(f"Rate limited by the API: {error.message}", status, True, retry_after)
+        retryable = status in RETRYABLE_STATUS or status >= 500
+        return APIRequestError(f"The API returned {status}: {error.message}", status, retryable, retry_after)
+    return APIRequestError(str(error) or error.__class__.__name__)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Full-jitter exponential backoff, never shorter than the server's Retry-After.
+    """
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+
+def _timed(attempt, kind, deadline):
+    start = time.monotonic()
+    result = attempt(deadline.remaining())
+    latencies.record(kind, time.monotonic() - start)
+    return result
+
+
+def _hedged(attempt, kind, deadline):
+    """
+    Run attempt, and if it is still running after the recent p95 latency of this
+    kind of request, start a duplicate; return whichever succeeds first.
+    The slower one is left to finish in the background and its result ignored.
+    The duplicate is only sent if the rate limiter has a token to spare right away.
+    """
+    threshold = latencies.percentile(kind)
+    if threshold is None or threshold >= deadline.remaining():
+        return _timed(attempt, kind, deadline)
+
+    condition = threading.Condition()
+    outcomes = []
+
+    def run():
+        try:
+            outcome = (True, _timed(attempt, kind, deadline))
+        except Exception as e:
+            outcome = (False, e)
+        with condition:
+            outcomes.append(outcome)
+            condition.notify_all()
+
+    threading.Thread(target=propagate(run), daemon=True).start()
+    started = 1
+    with condition:
+        answered = condition.wait_for(lambda: outcomes, timeout=threshold)
+    # Not under the condition, so the first attempt can always post its outcome
+    if not answered and rate_limiter.try_acquire():
+        count("hedged_requests")
+        threading.Thread(target=propagate(run), daemon=True).start()
+        started = 2
+    with condition:
+        while True:
+            condition.wait_for(lambda: any(ok for ok, _ in outcomes) or len(outcomes) == started,
+                               timeout=max(0.0, deadline.remaining()))
+            for ok, value in outcomes:
+                if ok:
+                    return value
+            if len(outcomes) == started:
+                raise outcomes[0][1]
+            deadline.check()
+
+
+def call_with_retries(attempt, kind, deadline, retries=MAX_RETRIES, hedge=False):
+    """
+    Run attempt(timeout) until it succeeds, within deadline.
+
+    Each attempt first takes a token from the shared rate limiter and gets the
+    time left before the deadline as its timeout. Retryable failures are retried
+    up to `retries` times after a jittered exponential backoff, which honors the
+    Retry-After of rate-limited responses (the limiter is paused for everyone).
+    With hedge, an attempt slower than the recent p95 of `kind` is duplicated.
+
+    Raises:
+        InstantGPTError: The last error (APIRequestError, RateLimited, DeadlineExceeded, ...).
+    """
+    for attempt_index in range(retries + 1):
+        deadline.check()
+        rate_limiter.acquire(deadline)
+        try:
+            if hedge:
+                return _hedged(attempt, kind, deadline)
+            return _timed(attempt, kind, deadline)
+        except Exception as e:
+            error = classify(e)
+            if isinstance(error, RateLimited):
+                count("rate_limited")
+                rate_limiter.pause(error.retry_after or BACKOFF_BASE_SECONDS)
+            if not error.retryable or attempt_index == retries:
+                if error is e:
+                    raise
+                raise error from e
+            delay = backoff_delay(attempt_index, getattr(error, "retry_after", None))
+            if delay >= deadline.remaining():
+                raise DeadlineExceeded(f"No time left to retry before the deadline: {error}") from e
+            count("retries")
+            print(f"Retrying {kind} in {delay:.1f}s: {error}")
+            time.sleep(delay)
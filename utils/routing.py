@@ -0,0 +1,130 @@
+import re
+import time
+import threading
+from collections import namedtuple
+from utils.config import env_flag, env_str, env_int, env_float
+
+# Models, from fastest to slowest
+FAST_MODEL = env_str("INSTANTGPT_FAST_MODEL", "gpt-4o-mini")
+STANDARD_MODEL = env_str("INSTANTGPT_STANDARD_MODEL", "gpt-4o")
+REASONING_MODEL = env_str("INSTANTGPT_REASONING_MODEL", "o1-preview")
+VISION_MODEL = env_str("INSTANTGPT_VISION_MODEL", "gpt-4o")
+MODEL_TIERS = (FAST_MODEL, STANDARD_MODEL, REASONING_MODEL)
+
+# Routing rules; with routing off, text always goes to REASONING_MODEL and images to VISION_MODEL
+ROUTING_ENABLED = env_flag("INSTANTGPT_ROUTING", True)
+# Explicit phrases only: single words like "think" occur in everyday questions ("what do you think?")
+REASONING_KEYWORDS = env_str(
+    "INSTANTGPT_REASONING_KEYWORDS",
+    "think step by step,step by step,think carefully,think hard,reason carefully,in depth,étape par étape,réfléchis bien",
+)
+FAST_KEYWORDS = env_str("INSTANTGPT_FAST_KEYWORDS", "quick,quickly,translate,rapide,traduis")
+LONG_PROMPT_CHARS = env_int("INSTANTGPT_LONG_PROMPT_CHARS", 4000)  # Longer prompts go to STANDARD_MODEL
+LATENCY_BUDGET_SECONDS = env_float("INSTANTGPT_LATENCY_BUDGET_SECONDS", 10)  # Slower models are stepped down a tier
+FALLBACK_SECONDS = env_float("INSTANTGPT_FALLBACK_SECONDS", 15)  # No output by then: switch to the fallback model
+LATENCY_SMOOTHING = 0.3  # Weight of the newest sample in the moving average
+LATENCY_MEMORY_SECONDS = 600  # Averages not updated for this long are forgotten
+
+# Lines that look like code
+CODE_PATTERN = re.compile(r"^\s*(def|class|function|import|#include|public|SELECT)\b|[;{}]\s*$", re.MULTILINE)
+
+Route = namedtuple("Route", ["model", "fallback", "reason"])
+
+
+def _keywords(setting):
+    return [keyword.strip().lower() for keyword in setting.split(",") if keyword.strip()]
+
+
+def _mentions(text, keywords):
+    text = text.lower()
+    return any(re.search(rf"\b{re.escape(keyword)}\b", text) for keyword in keywords)
+
+
+def looks_like_code(text):
+    """
+    Return True if text has a fenced block or at least three lines that look like code.
+    """
+    return "```" in text or len(CODE_PATTERN.findall(text)) >= 3
+
+
+class LatencyTracker:
+    """
+    Exponential moving average of the time to first output of each model.
+    Routing steps down from models that have recently been slower than the budget;
+    averages that have not been updated for LATENCY_MEMORY_SECONDS are dropped,
+    so a model gets another chance once it has been avoided for a while.
+    """
+
+    def __init__(self, smoothing=LATENCY_SMOOTHING, memory=LATENCY_MEMORY_SECONDS):
+        self.smoothing = smoothing
+        self.memory = memory
+        self._lock = threading.Lock()
+        self._averages = {}  # model -> (average seconds, last update)
+
+    def record(self, model, seconds):
+        with self._lock:
+            previous = self.get(model)
+            average = seconds if previous is None else previous + self.smoothing * (seconds - previous)
+            self._averages[model] = (average, time.monotonic())
+
+    def get(self, model):
+        """
+        Return the recent average in seconds, or None if there is none.
+        """
+        entry = self._averages.get(model)
+        if entry is None or time.monotonic() - entry[1] > self.memory:
+            return None
+        return entry[0]
+
+    def too_slow(self, model, budget=LATENCY_BUDGET_SECONDS):
+        average = self.get(model)
+        return average is not None and average > budget
+
+
+latency_tracker = LatencyTracker()
+
+
+def _within_budget(model, reason):
+    """
+    Step down the tiers from model until one whose recent latency fits the budget.
+    """
+    if model not in MODEL_TIERS:
+        return Route(model, None, reason)
+    tier = MODEL_TIERS.index(model)
+    while tier > 0 and latency_tracker.too_slow(MODEL_TIERS[tier]):
+        tier -= 1
+        reason = f"{reason}, {MODEL_TIERS[tier + 1]} over latency budget"
+    fallback = MODEL_TIERS[tier - 1] if tier > 0 else None
+    return Route(MODEL_TIERS[tier], fallback, reason)
+
+
+def choose_route(transcript, clipboard_text=None, image=None):
+    """
+    Pick the model for a request.
+
+    Images go to VISION_MODEL. A spoken reasoning keyword selects REASONING_MODEL
+    (with no fallback: the user asked for it) and a fast keyword FAST_MODEL.
+    Otherwise code or a long prompt goes to STANDARD_MODEL and everything else
+    to FAST_MODEL. A model recently slower than the latency budget is replaced by
+    the next faster one, and the next faster model is the fallback if the chosen
+    one has not answered after FALLBACK_SECONDS.
+
+    Returns:
+        Route: (model, fallback model or None, reason).
+    """
+    if not ROUTING_ENABLED:
+        return Route(VISION_MODEL if image is not None else REASONING_MODEL, None, "routing disabled")
+
+    if image is not None:
+        return Route(VISION_MODEL, FAST_MODEL if VISION_MODEL != FAST_MODEL else None, "image")
+    if _mentions(transcript, _keywords(REASONING_KEYWORDS)):
+        return Route(REASONING_MODEL, None, "reasoning keyword")
+    if _mentions(transcript, _keywords(FAST_KEYWORDS)):
+        return Route(FAST_MODEL, None, "fast keyword")
+
+    prompt = f"{clipboard_text or ''}\n{transcript}"
+    if looks_like_code(prompt):
+        return _within_budget(STANDARD_MODEL, "code")
+    if len(prompt) > LONG_PROMPT_CHARS:
+        return _within_budget(STANDARD_MODEL, "long prompt")
+    return _within_budget(FAST_MODEL, "short prompt")
@@ -0,0 +1,150 @@
+import time
+import hashlib
+import threading
+from utils.config import env_flag, env_int, env_float
+from utils.tokens import count_tokens
+from utils.telemetry import span
+
+# Session mode: follow-up recordings continue the same conversation
+SESSION_MODE = env_flag("INSTANTGPT_SESSION", False)
+SESSION_HISTORY_TOKENS = env_int("INSTANTGPT_SESSION_HISTORY_TOKENS", 12000)  # Earlier turns sent verbatim, at most
+SESSION_KEEP_TURNS = env_int("INSTANTGPT_SESSION_KEEP_TURNS", 2)  # Latest turns that are never summarized
+SESSION_IDLE_MINUTES = env_float("INSTANTGPT_SESSION_IDLE_MINUTES", 30)  # A new conversation starts after this long
+SESSION_INSTRUCTIONS = (
+    "You are an assistant helping a user with their tasks. The user talks to you by voice and may share "
+    "their clipboard. Always respond in the language of the user unless otherwise specified."
+)
+
+
+class Turn:
+    """
+    One exchange, stored exactly as it is sent so that it is a stable prompt prefix.
+    attachment is the digest of the clipboard text included in user, if any.
+    """
+
+    __slots__ = ("user", "response", "attachment", "tokens")
+
+    def __init__(self, user, response, attachment=None):
+        self.user = user
+        self.response = response
+        self.attachment = attachment
+        self.tokens = count_tokens(user) + count_tokens(response)
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class Session:
+    """
+    Conversation kept across recordings.
+
+    Requests are laid out as a prefix that only grows: the instructions, the
+    summary of older turns, then the earlier turns word for word, followed by
+    the new turn. Consecutive requests therefore share their prefix and benefit
+    from the provider's prompt caching. Clipboard text is sent once and later
+    turns refer to it while it is still in the history.
+
+    Once the verbatim turns exceed SESSION_HISTORY_TOKENS, the oldest ones are
+    folded into the summary (compact), down to half the budget so that the
+    prefix changes only every few turns.
+    """
+
+    def __init__(self):
+        self.summary = ""
+        self.turns = []
+        self.summarized_turns = 0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._compacting = False
+
+    @property
+    def expired(self):
+        return time.monotonic() - self.updated > SESSION_IDLE_MINUTES * 60
+
+    def history_tokens(self):
+        with self._lock:
+            return sum(turn.tokens for turn in self.turns)
+
+    def _render(self, request_text, clipboard_content, image):
+        """
+        Return (user message as stored in the history, digest of the clipboard text it includes).
+        """
+        if image:
+            return f"[Screenshot from the clipboard]\n{request_text}", None
+        if not clipboard_content:
+            return request_text, None
+        digest = _digest(clipboard_content)
+        if any(turn.attachment == digest for turn in self.turns):
+            return f"Clipboard content: unchanged since it was shared earlier in this conversation.\n\n{request_text}", None
+        return f"Clipboard content:\n{clipboard_content}\n\n{request_text}", digest
+
+    def user_message(self, request_text, clipboard_content=None, image=None):
+        """
+        The user message of a new turn. With an image, only its text part:
+        the image is attached to this request but not kept in the history.
+        """
+        with self._lock:
+            if image:
+                return request_text
+            return self._render(request_text, clipboard_content, image)[0]
+
+    def prefix(self, system_role="system"):
+        """
+        Messages to send before the new turn: instructions, summary and earlier turns.
+        system_role is "user" for models that do not accept system messages.
+        """
+        with self._lock:
+            messages = [{"role": system_role, "content": SESSION_INSTRUCTIONS}]
+            if self.summary:
+                messages.append({"role": system_role, "content": f"Summary of the earlier conversation:\n{self.summary}"})
+            for turn in self.turns:
+                messages.append({"role": "user", "content": turn.user})
+                messages.append({"role": "assistant", "content": turn.response})
+            return messages
+
+    def add_turn(self, request_text, clipboard_content, image, response):
+        """
+        Record a completed turn, with the arguments its user_message was built from.
+        Returns True if the history is now over budget and should be compacted.
+        """
+        with self._lock:
+            user, attachment = self._render(request_text, clipboard_content, image)
+            self.turns.append(Turn(user, response, attachment))
+            self.updated = time.monotonic()
+            return sum(turn.tokens for turn in self.turns) > SESSION_HISTORY_TOKENS
+
+    def compact(self, summarize):
+        """
+        Fold the oldest turns into the summary until the rest fits in half the budget,
+        keeping at least SESSION_KEEP_TURNS. summarize(previous_summary, transcript)
+        returns the new summary; it is called without holding the lock.
+        """
+        with self._lock:
+            if self._compacting:
+                return
+            remaining = sum(turn.tokens for turn in self.turns)
+            if remaining <= SESSION_HISTORY_TOKENS:
+                return
+            folded = []
+            while len(self.turns) - len(folded) > SESSION_KEEP_TURNS and remaining > SESSION_HISTORY_TOKENS // 2:
+                turn = self.turns[len(folded)]
+                folded.append(turn)
+                remaining -= turn.tokens
+            if not folded:
+                return
+            self._compacting = True
+            previous_summary = self.summary
+
+        try:
+            transcript = "\n\n".join(f"User: {turn.user}\n\nAssistant: {turn.response}" for turn in folded)
+            with span("session_summary", turns=len(folded)):
+                summary = summarize(previous_summary, transcript)
+            with self._lock:
+                self.summary = summary
+                # Turns added meanwhile were appended after the folded ones
+                self.turns = self.turns[len(folded):]
+                self.summarized_turns += len(folded)
+        finally:
+            with self._lock:
+                self._compacting = False
@@ -0,0 +1,69 @@
+import threading
+from utils.config import env_flag, env_int
+from utils.telemetry import propagate
+
+# Speculative dispatch: start both clipboard variants while the user decides
+SPECULATE = env_flag("INSTANTGPT_SPECULATE", False)
+SPECULATE_MAX_CHARS = env_int("INSTANTGPT_SPECULATE_MAX_CHARS", 8000)  # Cost guard on the clipboard text
+
+
+class SpeculativeRequest:
+    """
+    Streamed LLM request started before the user has chosen it.
+
+    The response is buffered until adopt() is called; the buffered text is then
+    replayed to the new callback and the rest of the stream follows it directly,
+    so an adopted request may already be partly or fully answered. cancel()
+    stops a request that was not chosen.
+    """
+
+    def __init__(self, send_request, request_args):
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._parts = []
+        self._on_delta = None
+        self._on_done = None
+        self._result = None
+        self._thread = threading.Thread(target=propagate(self._run), args=(send_request, request_args), daemon=True)
+        self._thread.start()
+
+    def _run(self, send_request, request_args):
+        try:
+            result = send_request(*request_args, on_delta=self._deliver, cancel_event=self.cancel_event)
+        except Exception as e:
+            result = e  # Shown as the response if this request is adopted
+        with self._lock:
+            self._result = (result,)
+            on_done = self._on_done
+        if on_done:
+            on_done(result)
+
+    def _deliver(self, delta):
+        # Deliver under the lock so replayed and live deltas cannot interleave
+        with self._lock:
+            if self._on_delta is None:
+                self._parts.append(delta)
+            else:
+                self._on_delta(delta)
+
+    def adopt(self, on_delta, on_done):
+        """
+        Take over the request: on_delta receives the text streamed so far and
+        then every new delta, and on_done receives the full response (or the
+        exception that ended the request) once it is complete.
+        """
+        with self._lock:
+            for part in self._parts:
+                on_delta(part)
+            self._parts = []
+            self._on_delta = on_delta
+            self._on_done = on_done
+            finished = self._result
+        if finished:
+            on_done(finished[0])
+
+    def cancel(self):
+        """
+        Stop the request at its next streamed chunk.
+        """
+        self.cancel_event.set()
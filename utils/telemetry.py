@@ -0,0 +1,309 @@
+import os
+import json
+import atexit
+import time
+import queue
+import logging
+import functools
+import itertools
+import threading
+import contextvars
+import logging.handlers
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.config import env_flag, env_str, env_int, env_float
+
+# Timing spans: written to a rotating JSONL log, aggregated into metrics and
+# summarized on the result screen. INSTANTGPT_TELEMETRY=0 turns all of it off.
+TELEMETRY_ENABLED = env_flag("INSTANTGPT_TELEMETRY", True)
+TELEMETRY_LOG = env_str("INSTANTGPT_TELEMETRY_LOG", os.path.join(os.path.expanduser("~"), ".instantgpt", "spans.jsonl"))
+TELEMETRY_LOG_MB = env_float("INSTANTGPT_TELEMETRY_LOG_MB", 5)  # Size at which the log is rotated
+TELEMETRY_LOG_BACKUPS = 3
+METRICS_PORT = env_int("INSTANTGPT_METRICS_PORT", 0)  # Local Prometheus-style endpoint; 0 disables it
+
+# Histogram bucket upper bounds, in milliseconds
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# Spans shown, in this order, in the timing breakdown of the result screen
+SUMMARY_SPANS = (
+    ("record", "record"),
+    ("clipboard", "clipboard"),
+    ("transcription", "transcribe"),
+    ("llm_first_token", "first token"),
+    ("response", "response"),
+    ("render_result", "render"),
+)
+
+_current_trace = contextvars.ContextVar("instantgpt_trace", default=None)
+_trace_ids = itertools.count(1)
+_metrics_lock = threading.Lock()
+_histograms = {}  # span name -> [count, sum_ms, bucket counts...]
+_counters = {}
+_gauges = {}  # prefix -> function returning {name: value}, read when metrics are rendered
+_logger = None
+_logger_lock = threading.Lock()
+
+
+class Trace:
+    """
+    The spans recorded for one request, shared by every thread working on it.
+    """
+
+    def __init__(self):
+        self.id = f"{int(time.time())}-{next(_trace_ids)}"
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, duration_ms):
+        with self._lock:
+            self.spans.append((name, duration_ms))
+
+    def summary(self):
+        """
+        Return a compact one-line breakdown, e.g. "record 8.2s · transcribe 1.1s · first token 640ms".
+        When a span repeats (e.g. both speculative requests), the longest is shown.
+        """
+        with self._lock:
+            totals = {}
+            for name, duration_ms in self.spans:
+                totals[name] = max(totals.get(name, 0.0), duration_ms)
+        parts = [f"{label} {_format_ms(totals[name])}" for name, label in SUMMARY_SPANS if name in totals]
+        return " · ".join(parts)
+
+
+def _format_ms(duration_ms):
+    return f"{duration_ms / 1000:.1f}s" if duration_ms >= 1000 else f"{duration_ms:.0f}ms"
+
+
+class Span:
+    """
+    Times a block of code: use as `with span("name", key=value) as s:` and add
+    attributes later with s.set(...). Exceptions are recorded and re-raised.
+    """
+
+    __slots__ = ("name", "attrs", "trace", "start")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.trace = _current_trace.get()
+        self.start = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration_ms = (time.perf_counter() - self.start) * 1000
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _record(self.name, duration_ms, self.trace, self.attrs)
+        return False
+
+
+class _NoSpan:
+    """
+    Stand-in returned by span() when telemetry is disabled.
+    """
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **attrs):
+    """
+    Return a context manager timing a block as span `name`, attached to the current trace.
+    """
+    if not TELEMETRY_ENABLED:
+        return _NO_SPAN
+    return Span(name, attrs)
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function as span `name`. Does nothing when telemetry is disabled.
+    """
+    def decorate(function):
+        if not TELEMETRY_ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Span(name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_duration(name, seconds, **attrs):
+    """
+    Record a duration measured elsewhere (e.g. time to first token) as a span.
+    """
+    if TELEMETRY_ENABLED:
+        _record(name, seconds * 1000, _current_trace.get(), attrs)
+
+
+def count(name, amount=1):
+    """
+    Increment a counter exposed by the metrics endpoint.
+    """
+    if TELEMETRY_ENABLED:
+        with _metrics_lock:
+            _counters[name] = _counters.get(name, 0) + amount
+
+
+def register_gauges(prefix, read):
+    """
+    Expose the values returned by read() as instantgpt_<prefix>_<name> on the metrics endpoint.
+    """
+    with _metrics_lock:
+        _gauges[prefix] = read
+
+
+def start_trace():
+    """
+    Start a trace for a new request in the current context and return it.
+    asyncio tasks and asyncio.to_thread carry it along; use propagate() for other threads.
+    """
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def propagate(function):
+    """
+    Bind function to the current context (and so to the current trace), for work
+    handed to a thread or executor. Bind once per submission.
+    """
+    return functools.partial(contextvars.copy_context().run, function)
+
+
+def _record(name, duration_ms, trace, attrs):
+    if trace is not None:
+        trace.add(name, duration_ms)
+
+    with _metrics_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = [0, 0.0] + [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        histogram[0] += 1
+        histogram[1] += duration_ms
+        bucket = next((index for index, bound in enumerate(HISTOGRAM_BUCKETS_MS) if duration_ms <= bound), len(HISTOGRAM_BUCKETS_MS))
+        histogram[2 + bucket] += 1
+
+    entry = {"ts": round(time.time(), 3), "trace": trace.id if trace else None, "span": name, "ms": round(duration_ms, 2)}
+    entry.update(attrs)
+    # Serialized and written by the listener thread; only the dict is queued here
+    (_logger or _get_logger()).info(entry)
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.msg, default=str)
+
+
+def _get_logger():
+    """
+    Set up the rotating JSONL log on first use. Writes happen on a listener thread.
+    """
+    global _logger
+    with _logger_lock:
+        if _logger is not None:
+            return _logger
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(TELEMETRY_LOG)), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                TELEMETRY_LOG, maxBytes=int(TELEMETRY_LOG_MB * 1024 * 1024),
+                backupCount=TELEMETRY_LOG_BACKUPS, encoding="utf-8", delay=True)
+        except OSError as e:
+            print(f"Telemetry log disabled: {e}")
+            _logger = logging.getLogger("instantgpt.spans.disabled")
+            _logger.disabled = True
+            return _logger
+        handler.setFormatter(_JsonFormatter())
+
+        records = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(records, handler)
+        listener.start()
+        atexit.register(listener.stop)  # Flush the queued spans on exit
+
+        logger = logging.getLogger("instantgpt.spans")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(_DictQueueHandler(records))
+        _logger = logger
+        return logger
+
+
+class _DictQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Keep the dict as is for the JSON formatter instead of formatting it to a string here
+        return record
+
+
+def metrics_text():
+    """
+    Render counters and span histograms in the Prometheus text format.
+    """
+    lines = []
+    with _metrics_lock:
+        gauges = sorted(_gauges.items())
+    # Read outside the lock: the readers take their own
+    for prefix, read in gauges:
+        for name, value in sorted(read().items()):
+            lines.append(f"instantgpt_{prefix}_{name} {value}")
+    with _metrics_lock:
+        for name, value in sorted(_counters.items()):
+            lines.append(f"instantgpt_{name}_total {value}")
+        for name, histogram in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(HISTOGRAM_BUCKETS_MS + ("+Inf",), histogram[2:]):
+                cumulative += bucket_count
+                lines.append(f'instantgpt_span_ms_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'instantgpt_span_ms_count{{span="{name}"}} {histogram[0]}')
+            lines.append(f'instantgpt_span_ms_sum{{span="{name}"}} {histogram[1]:.2f}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """
+    Serve metrics_text() on http://127.0.0.1:<port>/metrics if telemetry is on and a port is set.
+    Returns the server, or None.
+    """
+    if not TELEMETRY_ENABLED or not port:
+        return None
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+    except OSError as e:
+        print(f"Could not start the metrics endpoint on port {port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,228 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from utils.config import env_int, env_str
+from utils.telemetry import span, propagate
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Clipboard text larger than the budget is reduced before it is sent
+CLIPBOARD_TOKEN_BUDGET = env_int("INSTANTGPT_CLIPBOARD_TOKEN_BUDGET", 6000)
+CLIPBOARD_STRATEGY = env_str("INSTANTGPT_CLIPBOARD_STRATEGY", "auto").lower()  # auto, dedupe, truncate, map-reduce or none
+MAP_CHUNK_TOKENS = env_int("INSTANTGPT_MAP_CHUNK_TOKENS", 4000)
+MAP_WORKERS = env_int("INSTANTGPT_MAP_WORKERS", 4)
+MAP_MAX_CHUNKS = env_int("INSTANTGPT_MAP_MAX_CHUNKS", 16)  # Cost guard: larger text is truncated first
+HEAD_SHARE = 1 / 3  # Truncation keeps this share of the budget from the start, the rest from the end
+TOKEN_ENCODING = "o200k_base"  # Tokenizer of the gpt-4o and o1 families
+
+# Digits, hex ids and timestamps vary between otherwise identical log lines
+VOLATILE_PATTERN = re.compile(r"0x[0-9a-f]+|[0-9a-f]{8,}|\d+", re.IGNORECASE)
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """
+    Load the tokenizer once; None if tiktoken is missing or its data cannot be loaded (e.g. offline).
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+            except Exception as e:
+                print(f"Token counts are estimated: {e}")
+    return _encoding
+
+
+def count_tokens(text):
+    """
+    Count the tokens of text with tiktoken, or estimate them at four characters per token.
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def fits(text, budget):
+    # A token is at least one character, so short text needs no counting
+    return len(text) <= budget or count_tokens(text) <= budget
+
+
+def dedupe_lines(text):
+    """
+    Merge lines that only differ by numbers, ids or timestamps (typical of logs),
+    keeping the first occurrence and noting how many times it was repeated.
+    """
+    counts = {}
+    first_lines = []
+    for line in text.splitlines():
+        key = VOLATILE_PATTERN.sub("#", line.strip())
+        if key not in counts:
+            counts[key] = 0
+            first_lines.append((key, line))
+        counts[key] += 1
+    return "\n".join(
+        line if counts[key] == 1 or not key else f"{line}  [repeated {counts[key]} times]"
+        for key, line in first_lines
+    )
+
+
+def _cut(line, budget, from_end=False):
+    """
+    Longest start (or end) of line within budget tokens, cut by characters.
+    """
+    chars = min(len(line), budget * 4)
+    while chars > 0:
+        piece = line[-chars:] if from_end else line[:chars]
+        tokens = count_tokens(piece)
+        if tokens <= budget:
+            return piece
+        chars = min(chars - 1, int(chars * budget / tokens))
+    return ""
+
+
+def truncate_head_tail(text, budget):
+    """
+    Keep the start and the end of text within budget tokens, dropping lines
+    from the middle; the end gets the larger share since recent log lines matter most.
+    A line too long for what is left of either share is cut by characters, so
+    that text on a single line (minified JSON, a log blob) keeps its start and end too.
+    """
+    lines = text.splitlines()
+    head_budget = int(budget * HEAD_SHARE)
+    tail_budget = budget - head_budget
+
+    head, head_used = [], 0
+    for line in lines:
+        tokens = count_tokens(line) + 1
+        if head_used + tokens > head_budget:
+            break
+        head.append(line)
+        head_used += tokens
+
+    tail, tail_used = [], 0
+    for line in reversed(lines[len(head):]):
+        tokens = count_tokens(line) + 1
+        if tail_used + tokens > tail_budget:
+            break
+        tail.append(line)
+        tail_used += tokens
+    tail.reverse()
+
+    middle = lines[len(head):len(lines) - len(tail)]
+    if not middle:
+        return text
+
+    # Fill what is left of each share with part of the first and last omitted lines
+    head_piece = _cut(middle[0], head_budget - head_used - 1)
+    last = middle[-1][len(head_piece):] if len(middle) == 1 else middle[-1]
+    tail_piece = _cut(last, tail_budget - tail_used - 1, from_end=True)
+    if head_piece or tail_piece:
+        omitted = sum(len(line) for line in middle) - len(head_piece) - len(tail_piece)
+        marker = f"[... {omitted:,} characters omitted ...]"
+    else:
+        marker = f"[... {len(middle)} lines omitted ...]"
+    return "\n".join(head + [piece for piece in (head_piece, marker, tail_piece) if piece] + tail)
+
+
+def split_chunks(text, chunk_tokens=MAP_CHUNK_TOKENS):
+    """
+    Split text into chunks of about chunk_tokens tokens on line boundaries;
+    a line too long for a chunk of its own is cut by characters to fill them.
+    """
+    chunks, current, used = [], [], 0
+
+    def flush():
+        nonlocal current, used
+        chunks.append("\n".join(current))
+        current, used = [], 0
+
+    for line in text.splitlines():
+        while True:
+            tokens = count_tokens(line) + 1
+            if used + tokens <= chunk_tokens:
+                current.append(line)
+                used += tokens
+                break
+            if current and tokens <= chunk_tokens:
+                flush()
+                continue
+            piece = _cut(line, chunk_tokens - used - 1)
+            if piece:
+                current.append(piece)
+                line = line[len(piece):]
+            flush()
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def map_reduce(text, question, extract):
+    """
+    Split text into chunks and run extract(chunk, question, index, total) on them
+    concurrently (map); the joined extracts replace the text in the final request,
+    which answers the question from them (reduce).
+    """
+    chunks = split_chunks(text)
+    if len(chunks) > MAP_MAX_CHUNKS:
+        # 10% headroom for chunks that are not filled up to the last token
+        chunks = split_chunks(truncate_head_tail(text, int(MAP_MAX_CHUNKS * MAP_CHUNK_TOKENS * 0.9)))
+
+    with ThreadPoolExecutor(max_workers=min(MAP_WORKERS, len(chunks))) as executor:
+        futures = [
+            executor.submit(propagate(extract), chunk, question, index, len(chunks))
+            for index, chunk in enumerate(chunks)
+        ]
+        extracts = [future.result() for future in futures]
+
+    parts = [
+        f"[Part {index + 1} of {len(chunks)}]\n{extract_text.strip()}"
+        for index, extract_text in enumerate(extracts)
+        if extract_text.strip() and extract_text.strip().upper() != "NOTHING"
+    ]
+    return "\n\n".join(parts) or "[Nothing in the clipboard is relevant to the request.]", len(chunks)
+
+
+def prepare_clipboard(text, question, extract, budget=CLIPBOARD_TOKEN_BUDGET, strategy=CLIPBOARD_STRATEGY):
+    """
+    Fit clipboard text into the token budget.
+
+    With the auto strategy, repeated lines are merged first, and if the text is
+    still too large it is reduced with map_reduce. The cheaper strategies run
+    locally: truncate keeps the start and the end, and dedupe merges repeated
+    lines and then truncates if needed. map-reduce makes one extra request per chunk.
+
+    Args:
+        text (str): The clipboard text.
+        question (str): What the user said, used by map-reduce to pick the relevant parts.
+        extract (callable): extract(chunk, question, index, total) returning the relevant part of a chunk.
+    Returns:
+        tuple: (text to send, note describing the strategy used, or None if the text was sent as is).
+    """
+    if strategy == "none" or fits(text, budget):
+        return text, None
+
+    with span("clipboard_reduce", strategy=strategy) as reduce:
+        original_tokens = count_tokens(text)
+        reduce.set(tokens=original_tokens)
+        over_budget = f"{original_tokens:,} tokens, over the {budget:,} budget"
+
+        if strategy in ("auto", "dedupe"):
+            deduped = dedupe_lines(text)
+            if fits(deduped, budget):
+                return deduped, f"{over_budget}: repeated lines merged ({count_tokens(deduped):,} tokens)"
+            if strategy == "dedupe":
+                return truncate_head_tail(deduped, budget), f"{over_budget}: repeated lines merged, start and end kept"
+            text = deduped
+
+        if strategy == "truncate":
+            return truncate_head_tail(text, budget), f"{over_budget}: start and end kept, middle omitted"
+
+        reduced, chunk_count = map_reduce(text, question, extract)
+        return reduced, f"{over_budget}: relevant parts extracted from {chunk_count} chunks (map-reduce)"
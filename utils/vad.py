@@ -0,0 +1,142 @@
+import numpy as np
+from utils.config import env_flag, env_int, env_float
+
+# Voice activity detection settings
+TRIM_SILENCE = env_flag("INSTANTGPT_TRIM_SILENCE", True)  # Drop leading/trailing silence and long pauses
+MAX_PAUSE_SECONDS = env_float("INSTANTGPT_MAX_PAUSE_SECONDS", 1.0)  # Longer pauses are shortened to this
+SPEECH_LEVEL = env_int("INSTANTGPT_SPEECH_LEVEL", 200)  # Minimum RMS of a speech frame
+FRAME_MS = 30  # Analysis frame length
+PADDING_SECONDS = 0.2  # Silence kept around speech so word edges are not clipped
+SPLIT_SEARCH_SECONDS = 10  # How far back from the size limit to look for a pause
+MIN_PAUSE_SECONDS = env_float("INSTANTGPT_MIN_PAUSE_SECONDS", 0.25)  # Shorter dips (between syllables) are not pauses
+
+
+def _mono(samples):
+    """
+    Return a 1-D float view of the samples, averaging the channels if needed.
+    """
+    samples = np.asarray(samples)
+    if samples.ndim > 1:
+        return samples.astype(np.float32).mean(axis=1)
+    return samples.astype(np.float32)
+
+
+def frame_energies(samples, rate, frame_ms=FRAME_MS):
+    """
+    Compute the RMS energy of each complete frame of frame_ms milliseconds.
+
+    Returns:
+        tuple: (energies, frame_length) where frame_length is in samples.
+    """
+    frame_length = max(1, int(rate * frame_ms / 1000))
+    mono = _mono(samples)
+    count = len(mono) // frame_length
+    frames = mono[:count * frame_length].reshape(count, frame_length)
+    return np.sqrt(np.mean(frames * frames, axis=1)), frame_length
+
+
+def speech_frames(energies):
+    """
+    Classify frames as speech with a threshold adapted to the recording's noise floor.
+
+    The threshold is three times the 10th-percentile energy, capped at 30% of the
+    95th percentile so a recording with no pauses is not classified as silence,
+    and never below SPEECH_LEVEL.
+    """
+    if not len(energies):
+        return np.zeros(0, dtype=bool)
+    noise_floor, loud = np.percentile(energies, [10, 95])
+    threshold = max(SPEECH_LEVEL, min(noise_floor * 3, loud * 0.3))
+    return energies >= threshold
+
+
+def compact_speech(samples, rate, max_pause=MAX_PAUSE_SECONDS):
+    """
+    Trim leading and trailing silence and shorten pauses longer than max_pause.
+
+    Returns:
+        numpy.ndarray: The kept samples (a copy), empty if no speech was found.
+    """
+    energies, frame_length = frame_energies(samples, rate)
+    speech = speech_frames(energies)
+    if not speech.any():
+        return samples[:0]
+
+    # Keep a little silence around each stretch of speech
+    padding = int(PADDING_SECONDS * 1000 / FRAME_MS)
+    keep = np.convolve(speech.astype(np.int8), np.ones(2 * padding + 1, dtype=np.int8))
+    keep = keep[padding:padding + len(speech)] > 0
+
+    # Shorten every silent run between the first and last kept frame
+    half_pause = max(1, int(max_pause * 1000 / FRAME_MS) // 2)
+    edges = np.diff(np.concatenate(([1], keep.astype(np.int8), [1])))
+    starts, ends = np.flatnonzero(edges == -1), np.flatnonzero(edges == 1)
+    for start, end in zip(starts, ends):
+        if start == 0 or end == len(keep):
+            continue  # Leading or trailing silence is dropped entirely
+        if end - start <= 2 * half_pause:
+            keep[start:end] = True
+        else:
+            keep[start:start + half_pause] = True
+            keep[end - half_pause:end] = True
+
+    mask = np.repeat(keep, frame_length)
+    mask = np.concatenate((mask, np.full(len(samples) - len(mask), keep[-1])))
+    return samples[mask]
+
+
+def find_split_points(samples, rate, max_samples, search_seconds=SPLIT_SEARCH_SECONDS):
+    """
+    Choose split points so that every chunk holds at most max_samples samples,
+    cutting at the quietest moment of the last search_seconds before each limit
+    (but never in the first half of a chunk).
+
+    Returns:
+        list: Sample indices where a new chunk starts (the first chunk starts at 0).
+    """
+    energies, frame_length = frame_energies(samples, rate)
+    if not len(energies):
+        return list(range(max_samples, len(samples), max_samples))
+    # Smooth over ~300 ms so a cut lands in a pause rather than between two syllables
+    window = max(1, int(300 / FRAME_MS))
+    # Averaged over the frames actually there, so the edges do not look quieter than they are
+    kernel = np.ones(window)
+    smoothed = np.convolve(energies, kernel, mode="same") / np.convolve(np.ones(len(energies)), kernel, mode="same")
+
+    points = []
+    start = 0
+    while len(samples) - start > max_samples:
+        limit = start + max_samples
+        first_frame = -(-max(start + max_samples // 2, limit - int(search_seconds * rate)) // frame_length)
+        last_frame = min(limit // frame_length - 1, len(smoothed))
+        if last_frame > first_frame:
+            # The latest of equally quiet moments, for chunks as large as allowed
+            quietest = last_frame - 1 - int(np.argmin(smoothed[first_frame:last_frame][::-1]))
+            # The smoothed minimum spans the whole pause; cut at its quietest frame
+            low, high = max(first_frame, quietest - window), min(last_frame, quietest + window + 1)
+            quietest = low + int(np.argmin(energies[low:high]))
+            cut = quietest * frame_length + frame_length // 2
+        else:
+            cut = limit
+        points.append(cut)
+        start = cut
+    return points
+
+
+def find_pause(samples, rate, level, min_pause=MIN_PAUSE_SECONDS):
+    """
+    Find the last pause in samples: a run of at least min_pause whose frames all
+    have an RMS below level. A single quiet frame inside a word is not enough.
+
+    Returns:
+        int: The sample index in the middle of the pause, or None if there is none.
+    """
+    energies, frame_length = frame_energies(samples, rate)
+    quiet = energies < level
+    edges = np.diff(np.concatenate(([0], quiet.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    long_enough = ends - starts >= max(1, -(-int(min_pause * 1000) // FRAME_MS))
+    if not long_enough.any():
+        return None
+    start, end = starts[long_enough][-1], ends[long_enough][-1]
+    return int((start + end) // 2 * frame_length)
@@ -0,0 +1,87 @@
+import io
+import struct
+
+WAV_HEADER_SIZE = 44
+
+
+def wav_header(data_size, channels, rate, sample_width):
+    """
+    Build the 44-byte RIFF header of a PCM WAV file holding data_size bytes of frames.
+    """
+    block_align = channels * sample_width
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, channels, rate, rate * block_align, block_align, sample_width * 8,
+        b'data', data_size,
+    )
+
+
+class WavPayload(io.RawIOBase):
+    """
+    Read-only, seekable WAV file backed by a slice of a PCM buffer.
+
+    The header is generated on creation and the frames are served straight from
+    the memoryview, so uploading a chunk never copies the recording or touches
+    the disk. Instances can be passed anywhere a binary file object is expected.
+    """
+
+    def __init__(self, frames, channels, rate, sample_width, name="audio.wav"):
+        super().__init__()
+        self.name = name
+        self.channels = channels
+        self.rate = rate
+        self.sample_width = sample_width
+        self.frames = memoryview(frames).cast('B')
+        self.header = wav_header(len(self.frames), channels, rate, sample_width)
+        self.size = len(self.header) + len(self.frames)
+        self._position = 0
+
+    @property
+    def duration(self):
+        return len(self.frames) / (self.rate * self.channels * self.sample_width)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+
+    def readinto(self, buffer):
+        target = memoryview(buffer).cast('B')
+        written = 0
+        header_size = len(self.header)
+
+        if self._position < header_size:
+            count = min(len(target), header_size - self._position)
+            target[:count] = self.header[self._position:self._position + count]
+            written = count
+            self._position += count
+
+        start = self._position - header_size
+        count = min(len(target) - written, len(self.frames) - start)
+        if start >= 0 and count > 0:
+            target[written:written + count] = self.frames[start:start + count]
+            written += count
+            self._position += count
+
+        return written
+
+    def save(self, filename):
+        """
+        Write the payload to disk, for debugging.
+        """
+        with open(filename, 'wb') as wav_file:
+            wav_file.write(self.header)
+            wav_file.write(self.frames)